@@ -1,57 +1,243 @@
 # https://projects.raspberrypi.org/en/projects/fetching-the-weather/
 
-from requests import get
+import requests
+from requests.adapters import HTTPAdapter
 import json
 from pprint import pprint
 from math import *
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import os
+import sys
+import importlib.util
+import threading
+import time
 import geocoder
 
+# greatcircle lives in ../shared; put that on the path unless it's already importable
+if importlib.util.find_spec('greatcircle') is None:
+    sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'shared'))
+from greatcircle import R_KM, distance
+from station_index import StationIndex
+
 # Raspberry Pi weather data retrieval
 
+# Point this somewhere else (e.g. a local server replaying recorded responses) to
+# run without the real API
+BASE_URL = 'https://apex.oracle.com/pls/apex/raspberrypi/weatherstation/'
+
+TIMEOUT = (5, 30) # Seconds to connect, and to wait for the response
+
+# Largest number of requests fetch_weather_many has in flight at once
+MAX_WORKERS = 16
+
+# Connections the shared session keeps open to the API; more than MAX_WORKERS so a
+# larger max_workers can still reuse them
+POOL_SIZE = 64
+
+# Seconds the station list and the machine's location are reused before being looked
+# up again
+STATIONS_TTL = 3600
+LOCATION_TTL = 3600
+
+# Where the station list is kept between runs (see fetch_stations)
+STATIONS_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'stations.json')
+
+_session = None
+_session_lock = threading.Lock()
+
+_stations = {} # base url -> (time.monotonic() when checked, stations)
+_stations_lock = threading.Lock()
+_location = None # (time.monotonic() when looked up, [lat, lon])
+
+_index = None
+_index_source = None # the station list _index was last refreshed from
+_index_lock = threading.Lock()
+
 # Data retrieval
 
 
-def fetch_stations():
+def get_session():
+    """
+    This function returns the HTTP session shared by every request, so connections to the
+    API are kept open and reused instead of being set up again for each station.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+        return _session
+
+
+def get_response(path, base_url=None, timeout=None, headers=None):
+    """
+    This function requests a path of the API over the shared session and returns the
+    response. Raises `requests.RequestException` if the request fails or times out.
+    """
+    response = get_session().get((base_url or BASE_URL) + path, timeout=timeout or TIMEOUT, headers=headers)
+    response.raise_for_status()
+    return response
+
+
+def get_items(path, base_url=None, timeout=None):
+    """
+    This function requests a path of the API and returns the 'items' of its JSON response.
+    """
+    return get_response(path, base_url, timeout).json()['items']
+
+
+def _read_stations_cache(url, path):
+    try:
+        with open(path) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return cached if cached.get('url') == url else None
+
+
+def _write_stations_cache(cached, path):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(cached, f)
+        os.replace(path + '.tmp', path)
+    except OSError:
+        pass # Can't keep the list between runs, but it's still cached in memory
+
+
+def fetch_stations(base_url=None, max_age=None, cache_path=None):
     """
     This function takes no arguments. When run, it will return all Raspberry Pi weather
     stations from around the world.
+
+    The list is cached in memory and on disk at `cache_path` (STATIONS_CACHE by default,
+    '' to skip the disk), and is reused without any request until it is `max_age` seconds
+    old (STATIONS_TTL by default). After that, the server is asked whether it changed
+    since (by ETag or Last-Modified), and the list is only downloaded again if it did.
     """
-    url = 'https://apex.oracle.com/pls/apex/raspberrypi/weatherstation/getallstations'
-    return get(url).json()['items']
+    url = (base_url or BASE_URL) + 'getallstations'
+    if max_age is None:
+        max_age = STATIONS_TTL
+    if cache_path is None:
+        cache_path = STATIONS_CACHE
+    with _stations_lock:
+        if url in _stations and time.monotonic() - _stations[url][0] < max_age:
+            return _stations[url][1]
+
+        cached = _read_stations_cache(url, cache_path) if cache_path else None
+        if cached is None or time.time() - cached['checked'] >= max_age:
+            headers = {}
+            if cached is not None and cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached is not None and cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+            response = get_response('getallstations', base_url, headers=headers)
+            if response.status_code != 304 or cached is None:
+                cached = {'url': url, 'items': response.json()['items'],
+                          'etag': response.headers.get('ETag'),
+                          'last_modified': response.headers.get('Last-Modified')}
+            cached['checked'] = time.time()
+            if cache_path:
+                _write_stations_cache(cached, cache_path)
 
+        # Count the in-memory copy's age from when it was last checked with the server
+        _stations[url] = (time.monotonic() - (time.time() - cached['checked']), cached['items'])
+        return cached['items']
 
-def fetch_weather(station_id):
+
+def fetch_weather(station_id, base_url=None):
     """
     This function takes a station id (found from above) and returns a list of the latest
     measurements from the specified station.
     """
-    url = 'https://apex.oracle.com/pls/apex/raspberrypi/weatherstation/getlatestmeasurements/' + str(station_id)
-    return get(url).json()['items']
+    return get_items('getlatestmeasurements/' + str(station_id), base_url)
+
+
+def fetch_weather_many(station_ids, max_workers=MAX_WORKERS, base_url=None):
+    """
+    This function takes any number of station ids and fetches the latest measurements of
+    each, with up to `max_workers` requests running at once over the shared session. It
+    yields (station_id, measurements, error) as each request finishes, in whatever order
+    that happens: error is None on success, and otherwise the exception that request
+    raised (measurements is then None), so one bad station doesn't stop the rest.
+    """
+    def fetch(station_id):
+        try:
+            return station_id, fetch_weather(station_id, base_url), None
+        except (requests.RequestException, ValueError, KeyError) as e:
+            return station_id, None, e
+
+    station_ids = iter(station_ids)
+    with ThreadPoolExecutor(max_workers) as pool:
+        # Only submit a couple of requests per thread ahead, so a long list of stations
+        # doesn't turn into a long list of waiting futures
+        pending = set()
+        try:
+            while True:
+                for station_id in station_ids:
+                    pending.add(pool.submit(fetch, station_id))
+                    if len(pending) >= 2 * max_workers:
+                        break
+                if not pending:
+                    return
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        finally:
+            for future in pending:
+                future.cancel()
 
 def haversine(lon1, lon2, lat1, lat2):
     """
     This function takes a pair of coordinates and calculates the distance between the two,
     using the Haversine formula. This is calculated in kilometers.
     """
-    lon1 = radians(lon1)
-    lat1 = radians(lat1)
-    lon2 = radians(lon2)
-    lat2 = radians(lat2)
+    return distance(lat1, lon1, lat2, lon2, R_KM)
+
+def find_me(max_age=None):
+    """
+    This is a function that takes no arguments and returns your machine's current lat/lon coordinates.
+    This will help find the closet Raspberry Pi weather station to you. The location is looked up
+    once and reused for `max_age` seconds (LOCATION_TTL by default).
+    """
+    global _location
+    if max_age is None:
+        max_age = LOCATION_TTL
+    if _location is not None and time.monotonic() - _location[0] < max_age:
+        return _location[1]
+    latlng = geocoder.ip('me').latlng
+    if latlng:
+        _location = (time.monotonic(), latlng)
+    return latlng
 
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
 
-    a = pow(sin(dlat/2), 2) + cos(lat1) * cos(lat2) * pow(sin(dlon/2), 2)
-    c = 2 * atan2(sqrt(a), sqrt(1-a))
+def station_index():
+    """
+    This function takes no arguments and returns a `StationIndex` of every station from
+    `fetch_stations()`. The index is built once and refreshed whenever the cached station
+    list is replaced.
+    """
+    global _index, _index_source
+    stations = fetch_stations()
+    with _index_lock:
+        if _index is None:
+            _index = StationIndex(stations)
+        elif stations is not _index_source:
+            _index.refresh(stations)
+        _index_source = stations
+        return _index
 
-    return c * 6371
 
-def find_me():
+def find_nearest(k=5):
     """
-    This is a function that takes no arguments and returns your machine's current lat/lon coordinates.
-    This will help find the closet Raspberry Pi weather station to you.
+    This function takes a number of stations and returns the ids of that many weather stations
+    closest to your machine's current location, nearest first, with their distances in kilometers.
     """
-    return geocoder.ip('me').latlng
+    my_lat, my_lon = find_me()
+    ids, km = station_index().nearest(my_lat, my_lon, k)
+    return list(ids), [float(d) for d in km]
 
 
 def find_closest():
@@ -59,20 +245,9 @@ def find_closest():
     This function takes no arguments and returns the closest weather station to your machine's current
     location. This is pulled from `find_me()` function.
     """
-    my_lon = find_me()[1]
-    my_lat = find_me()[0]
-    all_stations = fetch_stations()
-
-    smallest = 20036 # Longest possible distance between two points on Earth
-    for station in all_stations:
-        station_lon = station['weather_stn_long']
-        station_lat = station['weather_stn_lat']
-        distance = haversine(my_lon, station_lon, my_lat, station_lat)
-        if distance < smallest:
-            smallest = distances
-            closest_station = station['weather_stn_id']
-    return closest_station
-
+    my_lat, my_lon = find_me()
+    ids, km = station_index().nearest(my_lat, my_lon)
+    return ids[0]
 
 
 def fetch_closest():
@@ -17,7 +17,10 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import warnings; warnings.filterwarnings('ignore')
 from sklearn import linear_model 
-from sklearn.model_selection import train_test_split, cross_val_score, cross_val_predict
+from sklearn.model_selection import train_test_split, cross_val_predict
+from ingest import load_pws, load_noaa, noaa_wide
+from regression import kfold_scores, RecursiveLeastSquares
+from subsets import best_subsets
 
 
 # In[2]:
@@ -35,7 +38,7 @@ sns.set_theme(style="whitegrid")
 # In[3]:
 
 
-gp = pd.read_csv("weather_gloverpark.csv")
+gp = load_pws("weather_gloverpark.csv")
 
 gp.head()
 
@@ -46,40 +49,28 @@ gp.head()
 gp.tail()
 
 
-# We see that indeed, September temperatures seem somewhat higher than we would expect. However, before any analysis, we need to do some data cleaning. First, we'll remove any columns that we don't plan on using in our analysis.
+# We see that indeed, September temperatures seem somewhat higher than we would expect. However, before any analysis, we need to do some data cleaning. The export has many more columns than we plan on using in our analysis, and all of its data points include units. This is good practice when posting data somewhere, but will make analysis impossible. Furthermore, to make the dates easier to work with, we want them as datetime objects.
+# 
+# `load_pws` has already taken care of all of this (see `ingest.read_pws`): it only reads the date, temperature and precipitation columns (this export has no precipitation), strips the units as it parses them, and reads the dates as datetimes. It caches the cleaned frame, so later runs skip the parsing as long as the CSV hasn't changed.
 
 # In[5]:
 
 
-gp = gp.filter(['Date','temp_hi', 'temp_avg', 'temp_lo', 'cum_precip'])
-gp.head()
-
-
-# We really narrowed our dataset. This is okay, because we're only focusing on the temperature and precipitation. For a larger project, we could keep more of the other variables. The next issue that we notice is that our data points all include units. This is good practice when posting data somewhere, but will make analysis impossible, so we'll fix this. Furthermore, to make the dates easier to work with, we can covert them into datetime objects.
-
-# In[6]:
-
-
-gp[gp.columns[1:]] = (gp[gp.columns[1:]]
-                      .replace("F", "", regex = True)
-                      .replace("in", "", regex = True))
-gp[gp.columns[1:]] = gp[gp.columns[1:]].astype(float)
-gp["Date"] = pd.to_datetime(gp["Date"])
-gp.head()
+gp.dtypes
 
 
 # We've cleaned out any characters and coverted all of our columns, sans *Date*, to floats. We're ready to read in some more data and attempt to triangulate. 
 
 # We'll read in our NOAA data which comes from https://www.ncdc.noaa.gov/. It provides us with temperature and precipitation data for most of 2020 up until September. Again, we're using September because that's their most recent complete month. 
 
-# In[7]:
+# In[6]:
 
 
-noaa = pd.read_csv("noaa_sept.csv")
+noaa = load_noaa("noaa_sept.csv")
 noaa.head()
 
 
-# In[8]:
+# In[7]:
 
 
 set(noaa["NAME"])
@@ -87,52 +78,45 @@ set(noaa["NAME"])
 
 # We see that we have three separate data sources that we have this data from; all varying distances away from our Glover Park weather station. Our goal is to create a model that gives us weights for each pf these weather stations and render our personal weather station obsolete. However, personal weather stations are fun and can add data to networks (see Weather Undergound), helping to create even stronger weather readings. So while our model may be able to render our station obsolete, that's not the purpose of this project.
 
-# Similar to above, we want to clean the data to ensure we are working with the correct structures. 
+# Similar to above, we want to clean the data to ensure we are working with the correct structures. `load_noaa` has already done this (see `ingest.clean_noaa`): every measurement is a float and *DATE* is a datetime.
 
-# In[9]:
+# In[8]:
 
 
-noaa[noaa.columns[3:]] = noaa[noaa.columns[3:]].astype(float)
-noaa["DATE"] = pd.to_datetime(noaa["DATE"])
+noaa.dtypes
 
 
-# We now want to clean this data, such that we only include September data and we clean out some of the unnecessary columns. 
+# We now want to clean this data, such that we only include September data from the three stations we're comparing against. We'll name each station by its GHCN ID, and give it a short number to use in column names. For reference, below is each station and its number:
+# 
+# - Station 1: Dalecarlia Reservoir
+# - Station 2: National Arboretum
+# - Station 3: Reagan National Airport
 
-# In[10]:
+# In[9]:
 
 
-noaa = noaa.drop(["DAPR", "MDPR"], axis = 1)
-noaa_sept = noaa[noaa["DATE"].dt.month == 9]
-noaa_sept = noaa_sept.rename(columns={"DATE": "Date"})
-noaa_sept.head()
+stations = {"USC00182325": "1", "USC00186350": "2", "USW00013743": "3"}
 
 
-# One of the last data clean task before we join our two data sources is to widen our data set. This means that there should be a column for each observsation. In other words, instead of one date taking up three different rows, we will create three *TMAX* columns: one for each location. We'll repeat this process for *TMIN* and *PRCP*. 
+# We also want to widen our data set. This means that there should be a column for each observsation. In other words, instead of one date taking up three different rows, we will create three *TMAX* columns: one for each location. We'll repeat this process for *TMIN* and *PRCP*. `noaa_wide` (see `ingest.py`) does the filtering and widening in one pass over the export, naming each column after its measurement and station, so adding a station or another month's file doesn't shift any of the others.
 
-# In[11]:
+# In[10]:
 
 
-noaa_sept = noaa_sept.pivot(index = "Date", columns = "STATION", values = ["TMAX", "TMIN", "PRCP"])
+noaa_sept = noaa_wide("noaa_sept.csv", start="2020-09-01", end="2020-09-30",
+                      stations=list(stations), labels=stations)
 noaa_sept.head()
 
 
-# And finally, the end of the arduous data clean process. Due to the `pivot`, we must drop a level off the multilevel dataframe. After this, we'll get repeated columns names, so we'll rename all of out columns. For reference, below is each station and its new corresponding number attached to it:
-# 
-# - Station 1: Dalecarlia Reservoir
-# - Station 2: National Arboretum
-# - Station 3: Reagan National Airport
-
-# In[12]:
+# In[11]:
 
 
-noaa_sept.columns = noaa_sept.columns.droplevel(0)
-noaa_sept.columns = ["TMAX_1", "TMAX_2", "TMAX_3", "TMIN_1", "TMIN_2", "TMIN_3", "PRCP_1", "PRCP_2", "PRCP_3"]
-noaa_sept.head()
+noaa_sept.columns
 
 
 # It looks like all is in order for as far as data cleaning goes, so now we'll have to join our two tables by date.
 
-# In[13]:
+# In[12]:
 
 
 weather = pd.merge(left=gp, right=noaa_sept, how="inner", on="Date")
@@ -146,7 +130,7 @@ weather.head()
 
 # Before we do any regression analysis, we'll take a look at our data and make sure it satisfies any assumptions. We'll first look at how the PWS data is distrbuted.
 
-# In[14]:
+# In[13]:
 
 
 plt.hist(weather["temp_hi"], bins = 10)
@@ -158,7 +142,7 @@ plt.show()
 
 # We can see that the daily high temperature does not seem to have any distinct shape or skew. We'll further inverstigate by looking at the daily lows and averages.
 
-# In[15]:
+# In[14]:
 
 
 plt.hist(weather["temp_lo"], bins = 10)
@@ -174,14 +158,14 @@ plt.show()
 
 # Our response variable will be our PWS daily high temperatures, with our predictors being each of the three stations daily highs. After choosing these variables, our first step is to split our data into training and testing sets.  We will set aside 75% of our data for training the model, and the other 25% for testing the accuracy. This split is rather high, but with n = 28, we need to spend more of our data on training our model and making it less susceptible to outliers. 
 
-# In[16]:
+# In[15]:
 
 
 X_train, X_test, y_train, y_test = train_test_split(weather[["TMAX_1", "TMAX_2", "TMAX_3"]], weather["temp_hi"], test_size=0.25, random_state = 51)
 X_train.shape, y_train.shape
 
 
-# In[17]:
+# In[16]:
 
 
 X_test.shape, y_test.shape
@@ -189,14 +173,14 @@ X_test.shape, y_test.shape
 
 # Now that we're all set, we'll first attempt this regression using the maximum daily temperature.
 
-# In[18]:
+# In[17]:
 
 
 lm = linear_model.LinearRegression()
 weather_lm = lm.fit(X_train, y_train)
 
 
-# In[19]:
+# In[18]:
 
 
 weather_lm.intercept_, weather_lm.coef_
@@ -204,7 +188,7 @@ weather_lm.intercept_, weather_lm.coef_
 
 # Thus, our estimated regression function is $\widehat{temp\_hi} = -5.29024 + 0.10998TMAX\_1 - 0.317634TMAX\_2 + 1.14581TMAX\_3$
 
-# In[20]:
+# In[19]:
 
 
 weather_lm.score(X_test, y_test)
@@ -212,13 +196,13 @@ weather_lm.score(X_test, y_test)
 
 # Furthermore, our corresponding $R^2$ value is 92.94%. In other words, 92.94% of the variance in our PWS data can be explained by our estimated regression function using the other three weather stations. This is pretty good, however it's important to remember that we don't have a ton of data to go off of.
 
-# In[21]:
+# In[20]:
 
 
 predictions = lm.predict(X_test)
 
 
-# In[22]:
+# In[21]:
 
 
 plt.scatter(y_test, predictions)
@@ -231,7 +215,7 @@ plt.show()
 
 # Our predicted values seem to be pretty good. Ideally, we want them to follow the line $y = x$. It looks like there are a few observations that stray from this point but for the most part, our predicted values seem to be very solid. We'll check out the residuals next.
 
-# In[23]:
+# In[22]:
 
 
 sns.residplot(x=predictions, y=y_test, color="b")
@@ -243,17 +227,17 @@ sns.residplot(x=predictions, y=y_test, color="b")
 
 # Cross-validation is to make sure our model is as finely tuned as possible. Rather than splitting the data, we can perform corssvalidation with k folds. We want the $R^2$ values to be as high as possible. We'll use a for loop to see the optimal number of folds we should use for cross-validation.
 
-# In[24]:
+# In[23]:
 
 
-for i in range(2, 12):
-    cv = cross_val_score(weather_lm, weather[["TMAX_1", "TMAX_2", "TMAX_3"]], weather["temp_hi"], cv=i)
-    print("K: ", i, ", Score: ", cv[i-1], sep = "")
+cv = kfold_scores(weather[["TMAX_1", "TMAX_2", "TMAX_3"]], weather["temp_hi"], ks=range(2, 12))
+for k, scores in cv.items():
+    print("K: ", k, ", Mean score: ", scores.mean, ", Folds: ", scores.folds.round(3), sep = "")
 
 
-# It seems that using k = 4 folds is the optimal amount. We'll make predictions using `cv = 4`. Doing this estimates the accuracy of our linear regresion model by splitting the data, fitting a model, and computing the score four consecutive times. Each time it does this with different splits.
+# `kfold_scores` (see `regression.py`) gives the same folds and scores as `cross_val_score`, but fits every fold from one shared $X^TX$ and $X^Ty$ instead of refitting each time. The mean $R^2$ is highest with few folds and falls apart past k = 6: with only a month of data, each test fold is then three or four days, and an $R^2$ over so few points swings wildly (note the negative fold scores). We'll make predictions using `cv = 4`, which still leaves a week in each test fold. Doing this estimates the accuracy of our linear regresion model by splitting the data, fitting a model, and computing the score four consecutive times. Each time it does this with different splits.
 
-# In[25]:
+# In[24]:
 
 
 predictions = cross_val_predict(weather_lm, weather[["TMAX_1", "TMAX_2", "TMAX_3"]], weather["temp_hi"], cv = 4)
@@ -267,7 +251,7 @@ plt.show()
 
 # The cross validation method allows us to use four times the number of points than before, since we used `cv = 4`. Again, we see that our model looks really solid. Our $R^2$ most likely benefits from the increase in data points, but they're still very concentrated around $y = x$, with no obvious outliers. 
 
-# In[26]:
+# In[25]:
 
 
 sns.residplot(x=predictions, y=weather["temp_hi"], color="b")
@@ -275,6 +259,33 @@ sns.residplot(x=predictions, y=weather["temp_hi"], color="b")
 
 # Again, our residual vs. fit plot shows no obvious pattern, so again it seems that our predictions using cross-validation are good as well. 
 
+# ## Streaming Updates
+# 
+# As new daily readings come in, we don't need to refit the model from scratch. `RecursiveLeastSquares` (see `regression.py`) updates the fit one day at a time, and after every update its coefficients are the same as fitting `LinearRegression` to all of the days so far.
+
+# In[26]:
+
+
+online = RecursiveLeastSquares()
+for day in weather.itertuples():
+    online.partial_fit([day.TMAX_1, day.TMAX_2, day.TMAX_3], day.temp_hi)
+
+batch = linear_model.LinearRegression().fit(weather[["TMAX_1", "TMAX_2", "TMAX_3"]], weather["temp_hi"])
+print(online.coef_, online.intercept_)
+print(batch.coef_, batch.intercept_)
+
+
+# ## Choosing Predictors
+# 
+# So far we've hand-picked the three stations' highs as predictors. `best_subsets` (see `subsets.py`) searches every combination of the *TMAX*, *TMIN* and *PRCP* columns for the ones that best predict each of our station's daily high, low and average, and cross-validates the best few of each size.
+
+# In[27]:
+
+
+subset_scores = best_subsets(weather, keep=2, k=4)
+subset_scores.groupby("target", sort=False).head(3)
+
+
 # ## Further Steps
 
 # - Importing more data
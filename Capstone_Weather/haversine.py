@@ -1,6 +1,16 @@
 from math import *
+import importlib.util
+import os
+import sys
 import geocoder
 
+# greatcircle lives in ../shared; put that on the path unless it's already importable
+if importlib.util.find_spec('greatcircle') is None:
+    sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'shared'))
+from greatcircle import R_KM, distance
+
+HOME = (38.924507, -77.081216) # Where haversine_to_me measures from
+
 # Geocoder is not very accuarate....
 def find_me():
     """
@@ -9,25 +19,13 @@ def find_me():
     """
     return geocoder.ip('me').latlng
 
-def haversine_to_me(lat, lon):
+def haversine_to_me(lat, lon, origin=HOME):
     """
     This function takes a coordinate and calculates the distance between your machine and the given location,
-    using the Haversine formula. This is calculated in kilometers.
+    using the Haversine formula. This is calculated in kilometers. Arrays of coordinates give an array of
+    distances, and `origin` measures from somewhere else.
     """
-
-    lat1 = radians(38.924507)
-    lon1 = radians(-77.081216)
-    lat2 = radians(lat)
-    lon2 = radians(lon)
-
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-
-
-    a = pow(sin(dlat/2), 2) + cos(lat1) * cos(lat2) * pow(sin(dlon/2), 2)
-    c = 2 * atan2(sqrt(a), sqrt(1-a))
-
-    return c * 6371
+    return distance(origin[0], origin[1], lat, lon, R_KM)
 
 # Dalecarlia Reservoir
 print("Haversine distance to Dalecarlia (km):", haversine_to_me(38.9425, -77.1100))
@@ -0,0 +1,295 @@
+# Cached loading of the cleaned weather data for Project4_Weather.py
+#
+# Each source file is parsed and cleaned once; the typed frame is stored in
+# a columnar cache (Parquet, or pickle if pyarrow isn't installed) under a
+# key made of the file's content hash and CLEANING_VERSION. A warm run reads
+# the cache instead of the CSV, and editing one source only invalidates that
+# source's entry.
+
+import hashlib
+import os
+
+import pandas as pd
+
+# Bump whenever a cleaning function changes what it returns, so caches
+# written by older code are not reused
+CLEANING_VERSION = 2
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+
+try:
+    import pyarrow # noqa: F401
+    HAVE_PYARROW = True
+except ImportError:
+    HAVE_PYARROW = False
+
+# How cache entries are stored: 'parquet' (needs pyarrow) or 'pickle'
+CACHE_FORMAT = 'parquet' if HAVE_PYARROW else 'pickle'
+
+# The read_csv engine for whole files, whatever the cache format: pyarrow's
+# multithreaded reader when it's installed, otherwise pandas' C parser
+CSV_ENGINE = 'pyarrow' if HAVE_PYARROW else 'c'
+
+
+# Columns of the personal weather station export used by the analysis
+PWS_COLUMNS = ['Date', 'temp_hi', 'temp_avg', 'temp_lo', 'cum_precip']
+
+# The unit Weather Underground appends to each column's values, and the
+# dtype the column is stored as once the unit is stripped
+PWS_SCHEMA = {
+    'temp_hi': ('F', 'float32'),
+    'temp_avg': ('F', 'float32'),
+    'temp_lo': ('F', 'float32'),
+    'dew_hi': ('F', 'float32'),
+    'dew_avg': ('F', 'float32'),
+    'dew_lo': ('F', 'float32'),
+    'hum_hi': ('%', 'float32'),
+    'hum_avg': ('%', 'float32'),
+    'hum_lo': ('%', 'float32'),
+    'wind_hi': ('mph', 'float32'),
+    'wind_avg': ('mph', 'float32'),
+    'gust_hi': ('mph', 'float32'),
+    'press_hi': ('in', 'float32'),
+    'press_avg': ('in', 'float32'),
+    'press_lo': ('in', 'float32'),
+    'cum_precip': ('in', 'float32'),
+}
+
+
+def strip_units(frame, schema=PWS_SCHEMA):
+    """
+    This function takes a frame of station readings and, for every column named in the
+    schema, strips the unit suffix with vectorized string operations and converts the
+    column to its declared dtype. Values that aren't numbers become NaN.
+    """
+    for col in frame.columns:
+        if col not in schema:
+            continue
+        unit, dtype = schema[col]
+        if pd.api.types.is_numeric_dtype(frame[col]):
+            frame[col] = frame[col].astype(dtype)
+            continue
+        values = frame[col].str.removesuffix(unit).str.strip()
+        try:
+            frame[col] = values.astype(dtype)
+        except (TypeError, ValueError):
+            # Some cell isn't a number; only then pay for the slower coercion
+            frame[col] = pd.to_numeric(values, errors='coerce').astype(dtype)
+    return frame
+
+
+def clean_pws(gp, columns=PWS_COLUMNS, schema=PWS_SCHEMA):
+    """
+    This function takes a raw personal weather station (Weather Underground) frame and
+    returns the date, temperature and precipitation columns with their units stripped,
+    converted to the dtypes in the schema, and the dates as datetimes.
+    """
+    gp = gp.filter(columns)
+    gp["Date"] = pd.to_datetime(gp["Date"])
+    return strip_units(gp, schema)
+
+
+def read_pws(path="weather_gloverpark.csv", columns=PWS_COLUMNS, schema=PWS_SCHEMA,
+             chunksize=None, date_format=None):
+    """
+    This function reads a personal weather station export straight into typed columns.
+    Only `columns` are parsed, dates are parsed by read_csv itself (pass `date_format`
+    to skip format inference), and the unit columns are cleaned as they are read, so
+    no all-text copy of the frame is ever built.
+
+    With `chunksize`, it returns an iterator of cleaned frames of that many rows instead,
+    so exports larger than memory can be processed a piece at a time. Without it, the
+    file is read with CSV_ENGINE (the multithreaded pyarrow reader when pyarrow is
+    installed), whatever CACHE_FORMAT is set to.
+    """
+    header = pd.read_csv(path, nrows=0).columns
+    usecols = [col for col in columns if col in header]
+    options = dict(usecols=usecols, dtype={col: str for col in usecols if col in schema},
+                   parse_dates=['Date'], date_format=date_format)
+
+    def clean(frame):
+        return strip_units(frame[usecols], schema)
+
+    if chunksize is not None:
+        return (clean(chunk) for chunk in pd.read_csv(path, chunksize=chunksize, **options))
+    return clean(pd.read_csv(path, engine=CSV_ENGINE, **options))
+
+
+def read_noaa(path="noaa_sept.csv"):
+    """
+    This function reads a NOAA daily summaries export and cleans it with `clean_noaa`.
+    """
+    return clean_noaa(pd.read_csv(path))
+
+
+def clean_noaa(noaa):
+    """
+    This function takes a raw NOAA daily summaries export and returns it with every
+    measurement column as floats and DATE as datetimes.
+    """
+    noaa[noaa.columns[3:]] = noaa[noaa.columns[3:]].astype(float)
+    noaa["DATE"] = pd.to_datetime(noaa["DATE"])
+    return noaa
+
+
+# Measurements widened into one column per station by `noaa_wide`
+NOAA_VALUES = ('TMAX', 'TMIN', 'PRCP')
+
+
+def _noaa_pieces(source, values, chunksize):
+    """
+    This function yields a NOAA source in long form, a chunk at a time. A source can be a
+    path or an already loaded frame.
+    """
+    if isinstance(source, pd.DataFrame):
+        yield source[['STATION', 'DATE', *values]]
+        return
+    options = dict(usecols=['STATION', 'DATE', *values], dtype={'STATION': str},
+                   parse_dates=['DATE'], date_format='%Y-%m-%d')
+    if chunksize is None:
+        yield pd.read_csv(source, **options)
+    else:
+        yield from pd.read_csv(source, chunksize=chunksize, **options)
+
+
+def noaa_wide(sources, start=None, end=None, stations=None, values=NOAA_VALUES,
+              labels=None, chunksize=None):
+    """
+    This function takes NOAA daily summaries in long form (one row per station and day)
+    and returns them wide, indexed by Date, with one column per measurement and station
+    named like TMAX_USW00013743. `sources` is a path or frame, or a list of them such as
+    one export per month, and the files are read one at a time (and `chunksize` rows at a
+    time, if given).
+
+    Rows outside `start`..`end` (inclusive) or from stations not in `stations` are dropped
+    as each piece is read, and each piece is widened before it is kept, so memory grows
+    with the number of stations times days rather than with the size of the exports.
+    When `stations` is given, the columns are exactly those stations, in that order, with
+    NaN for any station that has no data; otherwise they are every station found, sorted.
+    `labels` maps station IDs to the suffix used in the column names instead of the ID.
+    """
+    if isinstance(sources, (str, os.PathLike, pd.DataFrame)):
+        sources = [sources]
+    values = list(values)
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+
+    pieces = []
+    for source in sources:
+        for long in _noaa_pieces(source, values, chunksize):
+            keep = pd.Series(True, index=long.index)
+            if start is not None:
+                keep &= long['DATE'] >= start
+            if end is not None:
+                keep &= long['DATE'] <= end
+            if stations is not None:
+                keep &= long['STATION'].isin(stations)
+            long = long[keep]
+            if len(long):
+                pieces.append(long.pivot_table(index='DATE', columns='STATION', values=values,
+                                               aggfunc='first'))
+
+    if pieces:
+        wide = pd.concat(pieces)
+        if not wide.index.is_unique:
+            # A day split across files or chunks: take each station's first reading
+            wide = wide.groupby(level=0).first()
+        wide = wide.sort_index()
+    else:
+        wide = pd.DataFrame(index=pd.DatetimeIndex([], name='DATE'))
+
+    if stations is None:
+        stations = sorted(set(wide.columns.get_level_values(-1))) if pieces else []
+    wide = wide.reindex(columns=pd.MultiIndex.from_product([values, list(stations)]))
+
+    labels = labels or {}
+    wide.columns = ['%s_%s' % (value, labels.get(station, station)) for value, station in wide.columns]
+    wide.index.name = 'Date'
+    return wide
+
+
+def file_hash(path, blocksize=1 << 20):
+    """
+    This function returns the hex BLAKE2 digest of a file's contents, read in blocks so
+    large exports are never held in memory at once.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def cache_prefix(path, loader):
+    """
+    This function returns the start of the cache file names for a source file and loader:
+    the source's name, the loader, and a hash of the source's absolute path, so two
+    sources with the same name in different directories don't share entries.
+    """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    where = hashlib.blake2b(os.path.abspath(path).encode(), digest_size=4).hexdigest()
+    return '%s.%s.%s.' % (stem, loader.__name__, where)
+
+
+def cache_path(path, loader, cache_dir=None):
+    """
+    This function returns where the cleaned frame for a source file would be cached.
+    The name is `cache_prefix` followed by the content hash and CLEANING_VERSION.
+    """
+    key = '%s%s.v%d' % (cache_prefix(path, loader), file_hash(path), CLEANING_VERSION)
+    return os.path.join(cache_dir or CACHE_DIR, key + ('.parquet' if CACHE_FORMAT == 'parquet' else '.pkl'))
+
+
+def _write_cache(frame, target):
+    tmp = target + '.tmp'
+    if CACHE_FORMAT == 'parquet':
+        frame.to_parquet(tmp)
+    else:
+        frame.to_pickle(tmp)
+    os.replace(tmp, target)
+
+
+def _read_cache(target):
+    if target.endswith('.parquet'):
+        return pd.read_parquet(target)
+    return pd.read_pickle(target)
+
+
+def load_cached(path, loader, cache_dir=None):
+    """
+    This function takes a source file and the function that reads and cleans it, and
+    returns the cleaned frame. The first call runs `loader(path)` and caches the result;
+    later calls with the same file contents read the cache. Older cache entries for the
+    same source and loader are removed when a new one is written.
+    """
+    target = cache_path(path, loader, cache_dir)
+    if os.path.exists(target):
+        return _read_cache(target)
+
+    frame = loader(path)
+
+    # Drop entries for older contents of this source before adding this one
+    directory = os.path.dirname(target)
+    os.makedirs(directory, exist_ok=True)
+    prefix = cache_prefix(path, loader)
+    for name in os.listdir(directory):
+        if name.startswith(prefix):
+            os.remove(os.path.join(directory, name))
+    _write_cache(frame, target)
+    return frame
+
+
+def load_pws(path="weather_gloverpark.csv", cache_dir=None):
+    """
+    This function returns the cleaned personal weather station data (see `read_pws`),
+    from the cache when the file hasn't changed.
+    """
+    return load_cached(path, read_pws, cache_dir=cache_dir)
+
+
+def load_noaa(path="noaa_sept.csv", cache_dir=None):
+    """
+    This function returns the cleaned NOAA data (see `read_noaa`), from the cache
+    when the file hasn't changed.
+    """
+    return load_cached(path, read_noaa, cache_dir=cache_dir)
@@ -0,0 +1,240 @@
+# Fast evaluation of the station-weighting regression in Project4_Weather.py
+#
+# For ordinary least squares, everything a fit needs is in the Gram matrix
+# X'X and X'y. kfold_scores computes those once for the whole data set and
+# gets each fold's training fit by subtracting the held-out rows' share,
+# so k-fold cross-validation for every k costs one pass over the data per
+# k instead of k refits.
+
+from collections import namedtuple
+
+import numpy as np
+from sklearn.linear_model import LinearRegression
+from sklearn.model_selection import cross_val_score
+
+# Cross-validation scores for one number of folds
+CVScores = namedtuple('CVScores', ['folds', 'mean'])
+
+
+def is_ols(estimator):
+    """
+    This function returns True if an estimator is a plain least-squares LinearRegression,
+    the one kind of model whose folds can be fit from shared sufficient statistics.
+    """
+    return type(estimator) is LinearRegression and not estimator.positive
+
+
+def center(X, y):
+    """
+    This function takes the predictors and response as anything array-like and returns
+    them as float arrays centered on their overall means. Shifting the data doesn't
+    change a fit with an intercept, but it keeps X'X well conditioned.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if X.ndim == 1:
+        X = X[:, None]
+    return X - X.mean(axis=0), y - y.mean(axis=0)
+
+
+def gram(X, y):
+    """
+    This function returns the sufficient statistics of a least-squares fit to some rows:
+    their count, the sums of X and y, X'X and X'y.
+    """
+    return len(X), X.sum(axis=0), y.sum(), X.T @ X, X.T @ y
+
+
+def ols_from_gram(n, sx, sy, G, b, fit_intercept=True):
+    """
+    This function takes the sufficient statistics of some rows (see `gram`) and returns
+    the least-squares coefficients and intercept fit to them. Returns None for the
+    coefficients when the system is too ill-conditioned to solve accurately from X'X,
+    whose condition number is the square of X's.
+    """
+    if fit_intercept:
+        # Center on these rows' means, as LinearRegression does
+        G = G - np.outer(sx, sx) / n
+        b = b - sx * sy / n
+    if n - fit_intercept < len(G) or np.linalg.cond(G) > 1 / np.sqrt(np.finfo(float).eps):
+        return None, None
+    coef = np.linalg.solve(G, b)
+    return coef, (sy - sx @ coef) / n if fit_intercept else 0.0
+
+
+def ols_from_rows(X, y, fit_intercept=True):
+    """
+    This function fits least squares directly to some rows, returning the minimum-norm
+    coefficients and the intercept, as LinearRegression does.
+    """
+    if not fit_intercept:
+        return np.linalg.lstsq(X, y, rcond=None)[0], 0.0
+    mx = X.mean(axis=0)
+    my = y.mean()
+    coef = np.linalg.lstsq(X - mx, y - my, rcond=None)[0]
+    return coef, my - mx @ coef
+
+
+def r2(y, pred):
+    """
+    This function returns the coefficient of determination of predictions, with the
+    same conventions as `sklearn.metrics.r2_score` for a constant y.
+    """
+    sse = np.sum((y - pred) ** 2)
+    sst = np.sum((y - y.mean()) ** 2)
+    if sst == 0:
+        return 1.0 if sse == 0 else 0.0
+    return 1 - sse / sst
+
+
+def kfold_bounds(n, k):
+    """
+    This function returns the start and stop row of each of k contiguous folds of n rows,
+    split the way `sklearn.model_selection.KFold` does (the first n % k folds get one
+    extra row).
+    """
+    sizes = np.full(k, n // k)
+    sizes[:n % k] += 1
+    stops = np.cumsum(sizes)
+    return np.column_stack([stops - sizes, stops])
+
+
+def ols_fold_scores(X, y, k, stats=None, fit_intercept=True):
+    """
+    This function returns the R^2 of least squares on each of k unshuffled folds of X and
+    y. Each fold's training fit comes from the statistics of all rows (`gram(X, y)`, which
+    can be passed in to share it between calls) minus those of the held-out rows; folds
+    for which that is too inaccurate are refit from their training rows.
+    """
+    if stats is None:
+        stats = gram(X, y)
+    scores = np.empty(k)
+    for f, (start, stop) in enumerate(kfold_bounds(len(X), k)):
+        Xf = X[start:stop]
+        yf = y[start:stop]
+        train = [total - part for total, part in zip(stats, gram(Xf, yf))]
+        coef, intercept = ols_from_gram(*train, fit_intercept=fit_intercept)
+        if coef is None:
+            rows = np.r_[0:start, stop:len(X)]
+            coef, intercept = ols_from_rows(X[rows], y[rows], fit_intercept)
+        scores[f] = r2(yf, Xf @ coef + intercept)
+    return scores
+
+
+def kfold_scores(X, y, ks=range(2, 12), estimator=None, n_jobs=None):
+    """
+    This function takes predictors, a response and the fold counts to try, and returns a
+    dict mapping each k to the CVScores (per-fold R^2 and their mean) of k-fold
+    cross-validation, with the same unshuffled folds and scores `cross_val_score(estimator,
+    X, y, cv=k)` would give.
+
+    With the default estimator (least-squares LinearRegression), X'X and X'y are computed
+    once and shared by every fold and every k. Any other estimator is cross-validated with
+    `cross_val_score`, running the folds on `n_jobs` processes.
+    """
+    if estimator is None:
+        estimator = LinearRegression()
+
+    scores = {}
+    if is_ols(estimator):
+        if estimator.fit_intercept:
+            X, y = center(X, y)
+        else:
+            X = np.asarray(X, dtype=np.float64).reshape(len(X), -1)
+            y = np.asarray(y, dtype=np.float64)
+        stats = gram(X, y)
+        for k in ks:
+            folds = ols_fold_scores(X, y, k, stats, estimator.fit_intercept)
+            scores[k] = CVScores(folds, folds.mean())
+    else:
+        for k in ks:
+            folds = cross_val_score(estimator, X, y, cv=k, n_jobs=n_jobs)
+            scores[k] = CVScores(folds, folds.mean())
+    return scores
+
+
+class RecursiveLeastSquares:
+    """
+    This class is a least-squares linear model that is updated as observations arrive,
+    without refitting: `partial_fit` takes one row or a mini-batch, and `coef_` and
+    `intercept_` are always those of LinearRegression fit to every row seen so far. Each
+    row costs O(p^2) for p predictors.
+
+    With a forgetting factor below 1, each row's weight in the fit is multiplied by it
+    for every row that arrives after it, so the model follows drift in the data (a factor
+    of 0.98 roughly averages over the last 50 days of daily readings).
+    """
+
+    def __init__(self, forgetting=1.0, fit_intercept=True):
+        if not 0 < forgetting <= 1:
+            raise ValueError("forgetting must be in (0, 1], not %r" % (forgetting,))
+        self.forgetting = forgetting
+        self.fit_intercept = fit_intercept
+        self.n_seen_ = 0
+        self.G = None  # weighted X'X of the rows seen, with a column of ones for the intercept
+        self.b = None  # weighted X'y
+        self.P = None  # inverse of G, once G is well conditioned
+        self.theta = None
+
+    def _design(self, X):
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        if self.fit_intercept:
+            X = np.column_stack([X, np.ones(len(X))])
+        return X
+
+    def partial_fit(self, X, y):
+        """
+        This function takes one row (a 1-D X and scalar y) or a mini-batch of rows and
+        updates the fit with them, returning the model.
+        """
+        X = self._design(X)
+        y = np.atleast_1d(np.asarray(y, dtype=np.float64))
+        m, q = X.shape
+        if self.G is None:
+            self.G = np.zeros((q, q))
+            self.b = np.zeros(q)
+
+        # Older rows lose a factor of forgetting per new row, including within the batch
+        lam = self.forgetting
+        decay = lam ** m
+        w = lam ** np.arange(m - 1, -1, -1)
+        self.G = decay * self.G + (X * w[:, None]).T @ X
+        self.b = decay * self.b + (X * w[:, None]).T @ y
+
+        if self.P is None or m >= q:
+            # Invert from scratch while starting up, or when that's cheaper than the update
+            if self.n_seen_ + m >= q and np.linalg.cond(self.G) < 1 / np.sqrt(np.finfo(float).eps):
+                self.P = np.linalg.inv(self.G)
+        else:
+            # Woodbury identity: an m x m solve instead of inverting G again
+            PX = self.P @ X.T
+            S = np.diag(lam ** np.arange(1, m + 1)) + X @ PX
+            self.P = (self.P - PX @ np.linalg.solve(S, PX.T)) / decay
+        if self.P is not None:
+            self.P = (self.P + self.P.T) / 2
+            self.theta = self.P @ self.b
+        else:
+            self.theta = np.linalg.lstsq(self.G, self.b, rcond=None)[0]
+        self.n_seen_ += m
+        return self
+
+    def fit(self, X, y):
+        """
+        This function forgets every row seen so far and fits the model to X and y.
+        """
+        self.__init__(self.forgetting, self.fit_intercept)
+        return self.partial_fit(X, y)
+
+    @property
+    def coef_(self):
+        return self.theta[:-1] if self.fit_intercept else self.theta
+
+    @property
+    def intercept_(self):
+        return self.theta[-1] if self.fit_intercept else 0.0
+
+    def predict(self, X):
+        """
+        This function returns the model's predictions for one row or a batch of rows.
+        """
+        return self._design(X) @ self.theta
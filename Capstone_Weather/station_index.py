@@ -0,0 +1,168 @@
+# A nearest-station index over the Raspberry Pi weather station list
+#
+# Station positions go into a scikit-learn BallTree with the haversine
+# metric, so nearest-k and within-radius lookups take a few tree visits
+# instead of a pass over every station. When the station list changes,
+# only the stations that were added, moved or removed are dealt with: new
+# positions are kept in a small side list searched directly, dropped ones
+# are masked out, and the tree is only rebuilt once those pile up.
+
+import importlib.util
+import os
+import sys
+
+import numpy as np
+from sklearn.neighbors import BallTree
+
+# greatcircle lives in ../shared; put that on the path unless it's already importable
+if importlib.util.find_spec('greatcircle') is None:
+    sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'shared'))
+from greatcircle import R_KM as R, distance
+
+
+def station_positions(stations):
+    """
+    This function takes station records as returned by `fetch_stations()` and returns a
+    dict from station id to its (lat, lon) in degrees, leaving out stations without a
+    position.
+    """
+    positions = {}
+    for station in stations:
+        lat = station.get('weather_stn_lat')
+        lon = station.get('weather_stn_long')
+        if lat is None or lon is None:
+            continue
+        positions[station['weather_stn_id']] = (float(lat), float(lon))
+    return positions
+
+
+class StationIndex:
+    """
+    This class answers nearest-station queries for one or many points at once:
+
+        index = StationIndex(fetch_stations())
+        ids, km = index.nearest(38.93, -77.07, k=5)
+        ids, km = index.within(38.93, -77.07, 25)
+
+    Distances are great-circle kilometers. `refresh` brings the index up to date with a
+    newer station list, doing work only for the stations that changed.
+    """
+
+    def __init__(self, stations=(), rebuild_fraction=0.1):
+        self.rebuild_fraction = rebuild_fraction
+        self.positions = {}
+        self._build({})
+        self.refresh(stations)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __repr__(self):
+        return 'StationIndex(%d stations)' % len(self)
+
+    def _build(self, positions):
+        self.positions = dict(positions)
+        self.ids = np.array(list(positions), dtype=object)
+        coords = np.radians(np.array(list(positions.values()), dtype=np.float64).reshape(-1, 2))
+        self.tree = BallTree(coords, metric='haversine') if len(coords) else None
+        self.alive = np.ones(len(coords), dtype=bool)
+        self.row = {station_id: i for i, station_id in enumerate(self.ids)}
+        self.extra_ids = []
+        self.extra_coords = np.empty((0, 2)) # degrees
+
+    def refresh(self, stations):
+        """
+        This function updates the index to a new station list (as from `fetch_stations()`)
+        and returns the number of stations that were added, moved or removed.
+        """
+        positions = station_positions(stations)
+        removed = [station_id for station_id in self.positions if station_id not in positions]
+        changed = {station_id: latlon for station_id, latlon in positions.items()
+                   if self.positions.get(station_id) != latlon}
+        if not removed and not changed:
+            return 0
+
+        pending = (len(self.extra_ids) + len(changed) + len(removed) + np.count_nonzero(~self.alive))
+        if pending > max(32, self.rebuild_fraction * len(self.ids)):
+            self._build(positions)
+            return len(removed) + len(changed)
+
+        # Mask out the old positions, and keep the new ones aside
+        for station_id in removed + list(changed):
+            if station_id in self.row:
+                self.alive[self.row.pop(station_id)] = False
+        keep = [i for i, station_id in enumerate(self.extra_ids)
+                if station_id not in changed and station_id in positions]
+        self.extra_ids = [self.extra_ids[i] for i in keep] + list(changed)
+        self.extra_coords = np.concatenate([self.extra_coords[keep],
+                                            np.array(list(changed.values())).reshape(-1, 2)])
+        self.positions = positions
+        return len(removed) + len(changed)
+
+    def _query(self, lats, lons):
+        scalar = np.ndim(lats) == 0 and np.ndim(lons) == 0
+        lats, lons = np.broadcast_arrays(np.atleast_1d(np.asarray(lats, dtype=np.float64)),
+                                         np.atleast_1d(np.asarray(lons, dtype=np.float64)))
+        return scalar, np.column_stack([lats.ravel(), lons.ravel()])
+
+    def _extra_distances(self, points):
+        """Angular distances from every query point to every station kept aside"""
+        return distance(points[:, :1], points[:, 1:], self.extra_coords[:, 0], self.extra_coords[:, 1], 1.0)
+
+    def nearest(self, lats, lons, k=1):
+        """
+        This function returns the ids of the k stations closest to a point, nearest first,
+        and their distances in km. Given arrays of points, it returns (points, k) arrays;
+        rows are padded with None and inf if there are fewer than k stations.
+        """
+        scalar, points = self._query(lats, lons)
+        m = len(points)
+        dist = np.full((m, 0), np.inf)
+        ids = np.empty((m, 0), dtype=object)
+
+        if self.tree is not None:
+            # Ask for enough extra neighbors to make up for masked-out stations
+            kk = min(k + np.count_nonzero(~self.alive), len(self.alive))
+            d, i = self.tree.query(np.radians(points), k=kk)
+            d = np.where(self.alive[i], d, np.inf)
+            dist, ids = d, self.ids[i]
+        if self.extra_ids:
+            dist = np.concatenate([dist, self._extra_distances(points)], axis=1)
+            ids = np.concatenate([ids, np.broadcast_to(np.array(self.extra_ids, dtype=object),
+                                                       (m, len(self.extra_ids)))], axis=1)
+
+        if dist.shape[1] < k:
+            pad = k - dist.shape[1]
+            dist = np.concatenate([dist, np.full((m, pad), np.inf)], axis=1)
+            ids = np.concatenate([ids, np.full((m, pad), None, dtype=object)], axis=1)
+        order = np.argsort(dist, axis=1, kind='stable')[:, :k]
+        dist = np.take_along_axis(dist, order, axis=1)
+        ids = np.take_along_axis(ids, order, axis=1)
+        ids[np.isinf(dist)] = None
+        dist = dist * R
+        return (ids[0], dist[0]) if scalar else (ids, dist)
+
+    def within(self, lats, lons, radius):
+        """
+        This function returns the ids of every station within `radius` km of a point,
+        nearest first, and their distances in km. Given arrays of points, it returns a
+        list with one (ids, distances) pair per point.
+        """
+        scalar, points = self._query(lats, lons)
+        results = [(np.empty(0, dtype=object), np.empty(0)) for point in points]
+        if self.tree is not None:
+            hits, dists = self.tree.query_radius(np.radians(points), r=radius / R,
+                                                 return_distance=True, sort_results=True)
+            for j, (i, d) in enumerate(zip(hits, dists)):
+                alive = self.alive[i]
+                results[j] = (self.ids[i[alive]], d[alive] * R)
+        if self.extra_ids:
+            extra = self._extra_distances(points) * R
+            for j, d in enumerate(extra):
+                near = d <= radius
+                if near.any():
+                    ids = np.concatenate([results[j][0], np.array(self.extra_ids, dtype=object)[near]])
+                    dist = np.concatenate([results[j][1], d[near]])
+                    order = np.argsort(dist, kind='stable')
+                    results[j] = (ids[order], dist[order])
+        return results[0] if scalar else results
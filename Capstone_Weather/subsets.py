@@ -0,0 +1,210 @@
+# Best-subset search for the station-weighting regression in Project4_Weather.py
+#
+# The residual sum of squares of every subset of the candidate columns
+# comes from one centered Gram matrix of all of them, so trying a subset is
+# a small solve rather than a refit. Subsets are enumerated by dropping one
+# column at a time, leaps-and-bounds style: a subset fits no better than
+# any set containing it, so a branch is cut as soon as its full set can't
+# beat the subsets already kept. The branches can be spread over a process
+# pool, and the subsets that survive are cross-validated.
+
+import heapq
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from regression import center, ols_fold_scores
+
+# Responses the PWS regression is asked to predict
+TARGETS = ('temp_hi', 'temp_lo', 'temp_avg')
+
+# Prefixes of the NOAA columns (see ingest.noaa_wide) that are candidate predictors
+CANDIDATE_PREFIXES = ('TMAX_', 'TMIN_', 'PRCP_')
+
+
+def rss(G, b, syy, subset):
+    """
+    This function takes the centered Gram matrix G = X'X, b = X'y and syy = y'y of all
+    candidate columns and returns the residual sum of squares of the least-squares fit
+    (with intercept) on the columns in `subset`.
+    """
+    idx = list(subset)
+    Gs = G[np.ix_(idx, idx)]
+    bs = b[idx]
+    try:
+        beta = np.linalg.solve(Gs, bs)
+    except np.linalg.LinAlgError:
+        beta = np.linalg.lstsq(Gs, bs, rcond=None)[0]
+    return max(syy - bs @ beta, 0.0)
+
+
+class _Best:
+    """
+    This class keeps the `keep` lowest-RSS subsets of each size seen so far.
+    """
+
+    def __init__(self, keep, max_size):
+        self.keep = keep
+        self.max_size = max_size
+        self.heaps = {size: [] for size in range(1, max_size + 1)}
+
+    def add(self, subset, value):
+        if not 1 <= len(subset) <= self.max_size:
+            return
+        heap = self.heaps[len(subset)]
+        if any(subset == kept for value, kept in heap):
+            return
+        if len(heap) < self.keep:
+            heapq.heappush(heap, (-value, subset))
+        elif value < -heap[0][0]:
+            heapq.heapreplace(heap, (-value, subset))
+
+    def worst(self, size):
+        heap = self.heaps[size]
+        return -heap[0][0] if len(heap) == self.keep else np.inf
+
+    def promising(self, value, smallest, largest):
+        """True if some size in smallest..largest still has room for a subset this good"""
+        return any(value < self.worst(size) for size in range(max(smallest, 1), min(largest, self.max_size) + 1))
+
+    def merge(self, other):
+        for heap in other.heaps.values():
+            for value, subset in heap:
+                self.add(subset, -value)
+
+    def rows(self):
+        return sorted((-value, subset) for heap in self.heaps.values() for value, subset in heap)
+
+
+def _branch(G, b, syy, subset, start, best):
+    """
+    This function explores every subset reachable from `subset` by dropping its columns
+    at positions `start` and later, recording them in `best`. Those descendants all keep
+    subset[:start], so they have between start and len(subset) - 1 columns, and none of
+    them fits better than `subset` itself; a child whose own RSS can't improve on any of
+    those sizes is not expanded.
+    """
+    for j in range(start, len(subset)):
+        child = subset[:j] + subset[j + 1:]
+        if not child:
+            continue
+        value = rss(G, b, syy, child)
+        best.add(child, value)
+        if best.promising(value, j, len(child) - 1):
+            _branch(G, b, syy, child, j, best)
+
+
+def _search(job):
+    G, b, syy, subset, start, best = job
+    _branch(G, b, syy, subset, start, best)
+    return best
+
+
+def _frontier(G, b, syy, p, best, size):
+    """
+    This function evaluates the top of the search tree in this process, breadth first,
+    until there are at least `size` open branches to hand out, and returns them as
+    (subset, start) pairs.
+    """
+    full = tuple(range(p))
+    best.add(full, rss(G, b, syy, full))
+    nodes = [(full, 0)]
+    while nodes and len(nodes) < size:
+        expanded = []
+        for subset, start in nodes:
+            for j in range(start, len(subset)):
+                child = subset[:j] + subset[j + 1:]
+                if not child:
+                    continue
+                value = rss(G, b, syy, child)
+                best.add(child, value)
+                if len(child) > 1:
+                    expanded.append((child, j))
+        if not expanded:
+            return []
+        nodes = expanded
+    return nodes
+
+
+def importance_order(G, b, syy):
+    """
+    This function returns the candidate columns ordered by how much the fit on all of them
+    worsens when each one is left out, most first. Searching in this order puts the
+    columns that matter at the front, where branches that drop them are cut early.
+    """
+    full = tuple(range(len(G)))
+    loss = [rss(G, b, syy, full[:j] + full[j + 1:]) for j in full]
+    return np.argsort(loss, kind='stable')[::-1]
+
+
+def best_subsets(weather, targets=TARGETS, candidates=None, keep=3, max_size=None, k=4, workers=1):
+    """
+    This function searches for the subsets of candidate predictor columns of `weather`
+    that best predict each target column with least squares. For every target and every
+    subset size, the `keep` subsets with the highest R^2 are found, then scored with
+    unshuffled k-fold cross-validation (see `regression.kfold_scores`).
+
+    `candidates` defaults to every TMAX_/TMIN_/PRCP_ column, and `max_size` to all of
+    them. The search runs in this process unless `workers` asks for more processes (None
+    for every core). Those are started by re-importing the calling script on Windows and
+    macOS, so that script needs an `if __name__ == '__main__':` guard.
+
+    Returns a frame with one row per subset found: the target, the number of columns,
+    the columns, R^2 on all rows, and the mean CV R^2, ranked best first by CV R^2
+    within each target.
+    """
+    if candidates is None:
+        candidates = [col for col in weather.columns if col.startswith(CANDIDATE_PREFIXES)]
+    candidates = list(candidates)
+    p = len(candidates)
+    if max_size is None:
+        max_size = p
+
+    # One Gram matrix covers every candidate and every target
+    X, Y = center(weather[candidates], weather[list(targets)])
+    G = X.T @ X
+    XY = X.T @ Y
+    YY = (Y * Y).sum(axis=0)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    jobs = []
+    found = []
+    orders = []
+    for t in range(len(targets)):
+        order = importance_order(G, XY[:, t], YY[t])
+        Gt = G[np.ix_(order, order)]
+        bt = XY[order, t]
+        best = _Best(keep, max_size)
+        nodes = _frontier(Gt, bt, YY[t], p, best, 4 * workers if workers > 1 else 1)
+        found.append(best)
+        orders.append(order)
+        # Each branch starts from the bounds found so far
+        jobs += [(t, (Gt, bt, YY[t], subset, start, best)) for subset, start in nodes]
+
+    if workers <= 1 or len(jobs) <= 1:
+        results = [_search(job) for t, job in jobs]
+    else:
+        with ProcessPoolExecutor(min(workers, len(jobs))) as pool:
+            results = list(pool.map(_search, [job for t, job in jobs]))
+    for (t, job), result in zip(jobs, results):
+        if result is not job[-1]:
+            found[t].merge(result)
+
+    rows = []
+    for t, target in enumerate(targets):
+        y = np.asarray(Y[:, t])
+        for value, subset in found[t].rows():
+            subset = sorted(orders[t][list(subset)])
+            cv = ols_fold_scores(X[:, subset], y, k)
+            rows.append((target, len(subset), [candidates[i] for i in subset],
+                         1 - value / YY[t] if YY[t] else np.nan, cv.mean()))
+
+    table = pd.DataFrame(rows, columns=['target', 'size', 'features', 'r2', 'cv_r2'])
+    table['target'] = pd.Categorical(table['target'], categories=list(targets))
+    table = table.sort_values(['target', 'cv_r2'], ascending=[True, False], kind='stable')
+    table['target'] = table['target'].astype(str)
+    return table.reset_index(drop=True)
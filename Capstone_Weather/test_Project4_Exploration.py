@@ -0,0 +1,139 @@
+#!/bin/python
+# Tests for fetching station data in Project4_Exploration
+#
+# The weather station API is replaced by a small local server that replays
+# a recorded response, so these run offline.
+#
+# Usage: python -m unittest test_Project4_Exploration   (from the Capstone_Weather directory)
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import Project4_Exploration as exploration
+
+# What getlatestmeasurements/<id> returned for one station
+RECORDED = {"items": [{"id": 1707156, "weather_stn_id": 255541, "ambient_temp": 14.44,
+                       "ground_temp": 11.81, "air_quality": 35.49, "air_pressure": 1012.38,
+                       "humidity": 70.31, "wind_direction": 247.5, "wind_speed": 4.03,
+                       "wind_gust_speed": 8.05, "rainfall": 0,
+                       "reading_timestamp": "2020-11-30T16:00:01Z",
+                       "created_by": "pi", "created_on": "2020-11-30T16:00:05Z"}],
+            "hasMore": False, "limit": 25, "offset": 0, "count": 1}
+
+DELAY = 0.05 # Seconds every request takes, so that requests overlap
+SLOW = 1.0   # Seconds the 'slow' station takes
+
+
+class ImportAnywhere(unittest.TestCase):
+    """The modules find ../shared themselves, wherever they're imported from"""
+
+    def test_import(self):
+        here = os.path.dirname(os.path.abspath(__file__))
+        env = {k: v for k, v in os.environ.items() if k != 'PYTHONPATH'}
+        for module in ('Project4_Exploration', 'station_index', 'haversine'):
+            for cwd, path in ((here, None), (tempfile.gettempdir(), here)):
+                with self.subTest(module=module, cwd=cwd):
+                    done = subprocess.run([sys.executable, '-c', 'import ' + module], cwd=cwd,
+                                          env=dict(env, PYTHONPATH=path) if path else env,
+                                          capture_output=True, text=True)
+                    self.assertEqual(done.returncode, 0, done.stderr)
+
+
+class StubAPI(BaseHTTPRequestHandler):
+    """Serves RECORDED for any station, except a few ids that misbehave"""
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.active += 1
+            server.most_active = max(server.most_active, server.active)
+        try:
+            station_id = self.path.rsplit('/', 1)[-1]
+            time.sleep(SLOW if station_id == 'slow' else DELAY)
+            if station_id == 'missing':
+                self.send_error(404)
+                return
+            body = b'<html>not json' if station_id == 'broken' else json.dumps(RECORDED).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass # The client gave up (timed out) first
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FetchWeatherMany(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubAPI)
+        self.server.daemon_threads = True
+        self.server.lock = threading.Lock()
+        self.server.active = self.server.most_active = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = 'http://127.0.0.1:%d/' % self.server.server_address[1]
+
+        # Give up on a response quickly, so the slow station times out
+        self.timeout = exploration.TIMEOUT
+        exploration.TIMEOUT = (1, 0.5)
+
+    def tearDown(self):
+        exploration.TIMEOUT = self.timeout
+        self.server.shutdown()
+        self.server.server_close()
+
+    def fetch(self, station_ids, max_workers=4):
+        return {station_id: (items, error) for station_id, items, error in
+                exploration.fetch_weather_many(station_ids, max_workers, self.base_url)}
+
+    def test_measurements(self):
+        results = self.fetch(range(10))
+        self.assertEqual(sorted(results), list(range(10)))
+        for items, error in results.values():
+            self.assertIsNone(error)
+            self.assertEqual(items, RECORDED['items'])
+
+    def test_errors_are_reported_per_station(self):
+        results = self.fetch(['missing', 'broken', 'slow', 1, 2])
+        self.assertIsInstance(results['missing'][1], requests.HTTPError)
+        self.assertEqual(results['missing'][1].response.status_code, 404)
+        self.assertIsInstance(results['broken'][1], ValueError)
+        self.assertIsInstance(results['slow'][1], requests.Timeout)
+        for station_id in ('missing', 'broken', 'slow'):
+            self.assertIsNone(results[station_id][0])
+        for station_id in (1, 2):
+            self.assertEqual(results[station_id], (RECORDED['items'], None))
+
+    def test_concurrency_limit(self):
+        for max_workers in (1, 3):
+            self.server.most_active = 0
+            results = self.fetch(range(12), max_workers)
+            self.assertEqual(len(results), 12)
+            self.assertEqual(self.server.most_active, max_workers)
+
+    def test_stops_early(self):
+        # Walking away from the generator cancels the requests not yet started
+        results = exploration.fetch_weather_many(range(1000), 2, self.base_url)
+        first = next(results)
+        results.close()
+        self.assertEqual(first[1:], (RECORDED['items'], None))
+        self.assertLessEqual(self.server.most_active, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
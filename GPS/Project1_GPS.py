@@ -8,10 +8,247 @@
 
 # Load the necessary modules
 from math import *
+import importlib.util
 import numpy as np
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
+import os
 import re
+import sys
+
+# greatcircle lives in ../shared; put that on the path unless it's already importable
+if importlib.util.find_spec('greatcircle') is None:
+    sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'shared'))
+from greatcircle import distance
+
+# A <trkpt> element (optionally namespace-prefixed, possibly self-closing):
+# group 1 is its attributes, group 2 its body
+_TRKPT = re.compile(rb'<(?:[\w.-]+:)?trkpt\b([^>]*?)'
+                    rb'(?:/>|>([^<]*(?:<(?!/(?:[\w.-]+:)?trkpt)[^<]*)*)</(?:[\w.-]+:)?trkpt\s*>)')
+_LAT = re.compile(rb'\blat\s*=\s*["\']([^"\']*)')
+_LON = re.compile(rb'\blon\s*=\s*["\']([^"\']*)')
+_ELE = re.compile(rb'<(?:[\w.-]+:)?ele\s*>([^<]*)<')
+_TIME = re.compile(rb'<(?:[\w.-]+:)?time\s*>([^<]*)<')
+# The usual <trkpt lat lon><ele/><time/>...</trkpt> layout, all fields in one
+# match. Both children are required, in that order, right after the opening
+# tag: a point laid out any other way doesn't match, and its block takes
+# the general path.
+_PLAIN_TRKPT = re.compile(rb'<trkpt\s+lat="([^"]*)"\s+lon="([^"]*)"\s*>\s*'
+                          rb'<ele>([^<]*)</ele>\s*<time>([^<]*)</time>'
+                          rb'[^<]*(?:<(?!/trkpt)[^<]*)*</trkpt\s*>')
+
+def _lastTrkptStart(buf):
+    """Offset of the last <trkpt opening tag in buf, or -1"""
+    end = len(buf)
+    while True:
+        i = buf.rfind(b'trkpt', 0, end)
+        if i < 0:
+            return -1
+        j = buf.rfind(b'<', 0, i)
+        if j >= 0 and (j == i - 1 or re.fullmatch(rb'[\w.-]+:', buf[j + 1:i])):
+            return j
+        end = i
+
+# Where the digits of each fixed field of YYYY-MM-DDTHH:MM:SS sit, and
+# the weights that turn them into year, month, day, hour, minute, second
+_ISO_DIGITS = [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18]
+_ISO_WEIGHTS = np.zeros((14, 6))
+for _field, _cols in enumerate(((0, 1, 2, 3), (4, 5), (6, 7), (8, 9), (10, 11), (12, 13))):
+    _ISO_WEIGHTS[list(_cols), _field] = 10.0 ** np.arange(len(_cols) - 1, -1, -1)
+del _field, _cols
+
+# Days in each month of a common year, indexed by month (1-12)
+_MONTH_DAYS = np.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+def _daysFromCivil(y, m, d):
+    """Days since 1970-01-01 of proleptic Gregorian dates (integer arrays)"""
+    y = y - (m <= 2)
+    era = y // 400
+    yoe = y - era * 400
+    doy = (153 * (m + np.where(m > 2, -3, 9)) + 2) // 5 + d - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+def _byteMatrix(a):
+    """Bytes of a fixed-width 'S' array as a NUL-padded uint8 matrix, with
+    spare columns past the longest string"""
+    w = a.dtype.itemsize
+    M = np.zeros((len(a), max(w, 28) + 8), dtype=np.uint8)
+    if w:
+        M[:, :w] = np.frombuffer(a.tobytes(), dtype=np.uint8).reshape(len(a), w)
+    return M
+
+def _parseISO8601(stamps):
+    """Parse timestamps into whole seconds since the epoch (UTC),
+    nanoseconds past that, and a mask of which stamps were valid"""
+
+    a = np.asarray(stamps)
+    if a.dtype.kind == 'U':
+        a = np.char.encode(a, 'ascii')
+    a = a.astype('S', copy=False)
+    n = len(a)
+    rows = np.arange(n)
+
+    M = _byteMatrix(a)
+    digit = (M >= 48) & (M <= 57)
+
+    # Fixed fields and separators: YYYY-MM-DD, 'T' or ' ', HH:MM:SS
+    ok = digit[:, _ISO_DIGITS].all(axis=1)
+    ok &= (M[:, 4] == 45) & (M[:, 7] == 45) & ((M[:, 10] == 84) | (M[:, 10] == 32))
+    ok &= (M[:, 13] == 58) & (M[:, 16] == 58)
+    fields = ((M[:, _ISO_DIGITS] - 48.0) @ _ISO_WEIGHTS).astype(np.int64)
+    year, month, day, hour, minute, second = fields.T
+    ok &= (month >= 1) & (month <= 12) & (day >= 1)
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    ok &= day <= _MONTH_DAYS[np.clip(month, 0, 12)] + ((month == 2) & leap)
+    ok &= (hour <= 24) & (minute <= 59) & (second <= 60)
+
+    # Fraction: the run of digits after a '.' in column 19, to 9 places
+    has_frac = M[:, 19] == 46
+    nfrac = np.where(has_frac, np.argmin(digit[:, 20:], axis=1), 0)
+    frac = np.where(np.arange(9) < nfrac[:, None], M[:, 20:29] - 48.0, 0.0)
+    ns = (frac @ 10.0 ** np.arange(8, -1, -1)).astype(np.int64)
+
+    # Then Z, nothing, or an offset +HH:MM, +HHMM or +HH (or -)
+    p = np.where(has_frac, 20 + nfrac, 19)
+    tz = M[rows, p]
+    sign = np.where(tz == 45, 1, np.where(tz == 43, -1, 0))
+    hh = np.minimum(p + 1, M.shape[1] - 5)
+    mm = np.where(M[rows, hh + 2] == 58, hh + 3, hh + 2)
+    oh = (M[rows, hh] - 48) * 10 + (M[rows, hh + 1] - 48.0)
+    om = np.where(digit[rows, mm] & digit[rows, mm + 1], (M[rows, mm] - 48) * 10 + (M[rows, mm + 1] - 48.0), 0)
+    ok &= (tz == 0) | (tz == 90) | ((sign != 0) & digit[rows, hh] & digit[rows, hh + 1])
+
+    # and the stamp has to end there: NUL is the padding past its last byte
+    end = np.where(tz == 0, p, np.where(tz == 90, p + 1,
+                   np.where(digit[rows, mm] & digit[rows, mm + 1], mm + 2, hh + 2)))
+    ok &= M[rows, end] == 0
+    offset = (sign * (oh * 3600 + om * 60)).astype(np.int64)
+
+    secs = _daysFromCivil(year, month, day) * 86400 + hour * 3600 + minute * 60 + second + offset
+
+    # Stamps padded with whitespace fail above; strip and retry just those
+    bad = np.flatnonzero(~ok)
+    if len(bad):
+        stripped = np.char.strip(a[bad])
+        retry = stripped != a[bad]
+        if retry.any():
+            bad = bad[retry]
+            secs[bad], ns[bad], ok[bad] = _parseISO8601(stripped[retry])
+    return secs, ns, ok
+
+def parse_iso8601(stamps):
+    """Parse ISO-8601 timestamps into seconds since 1970-01-01 UTC
+
+    ts = parse_iso8601(stamps)
+
+    Input: stamps = sequence or array of timestamps (bytes or str) like
+                    2020-08-30T05:10:05.908Z or 2020-08-30T01:10:05-04:00
+    Output: ts = float64 array of epoch seconds, NaN for stamps that are
+                 missing or not of that form
+
+    All stamps are parsed at once as columns of a byte matrix, with no
+    per-stamp Python work. Fractions keep up to nine digits, and a
+    stamp with no offset is taken as UTC."""
+
+    secs, ns, ok = _parseISO8601(stamps)
+    return np.where(ok, secs + ns * 1e-9, nan)
+
+def parse_iso8601_datetime64(stamps):
+    """Parse ISO-8601 timestamps into a datetime64[ns] array (UTC), NaT
+    where a stamp is missing or malformed"""
+
+    secs, ns, ok = _parseISO8601(stamps)
+    ok &= np.abs(secs) < 9 * 10 ** 9 # about the years 1685-2255
+    out = (secs * 10 ** 9 + ns).view('datetime64[ns]')
+    out[~ok] = np.datetime64('NaT')
+    return out
+
+def _toFloat(col):
+    """Convert a list of numeric byte strings to floats, empty ones to NaN"""
+    a = np.array(col)
+    missing = a == b''
+    if missing.any():
+        a = np.where(missing, b'nan', a)
+    return a.astype(np.float64)
+
+def _parseTrkpts(buf):
+    """Parse every complete <trkpt> in buf into an (n, 4) array of lat, lon, ele, t"""
+
+    # Nearly every file writes trackpoints the same plain way, which one
+    # findall can pick apart. Unless every trackpoint in buf matched it
+    # (each has an opening and a closing tag), take the general path below
+    n = buf.count(b'trkpt')
+    pts = _PLAIN_TRKPT.findall(buf)
+    if 2 * len(pts) != n:
+        pts = []
+        for attrs, body in _TRKPT.findall(buf):
+            m = _LAT.search(attrs)
+            lat = m.group(1) if m else b''
+            m = _LON.search(attrs)
+            lon = m.group(1) if m else b''
+            m = _ELE.search(body)
+            ele = m.group(1) if m else b''
+            m = _TIME.search(body)
+            pts.append((lat, lon, ele, m.group(1) if m else b''))
+
+    out = np.empty((len(pts), 4))
+    if pts:
+        lats, lons, els, ts = zip(*pts)
+        out[:, 0] = _toFloat(lats)
+        out[:, 1] = _toFloat(lons)
+        out[:, 2] = _toFloat(els)
+        out[:, 3] = parse_iso8601(ts)
+    return out
+
+def iterGPXChunks(filename, blocksize=1 << 22):
+    """Stream the trackpoints of a GPX file in chunks
+
+    for chunk in iterGPXChunks(filename): ...
+
+    Input: filename  = GPX file to read
+           blocksize = bytes read from the file at a time
+    Output: chunk = float array of shape (n, 4), one row per trackpoint
+                    holding lat, lon, ele, t, for successive trackpoints
+
+    The file is scanned a block at a time, so memory stays bounded by
+    the block size however long the track is. A point with no <ele> or
+    <time> gets NaN in that column, so the columns stay aligned."""
+
+    tail = b''
+    with open(filename, 'rb') as f:
+        while True:
+            block = f.read(blocksize)
+            if not block:
+                break
+            buf = tail + block
+
+            # Everything before the last opening tag is made of whole
+            # trackpoints; the rest waits for the next block
+            cut = _lastTrkptStart(buf)
+            if cut < 0:
+                tail = buf[-64:]
+                continue
+            tail = buf[cut:]
+            chunk = _parseTrkpts(buf[:cut])
+            if len(chunk):
+                yield chunk
+
+    chunk = _parseTrkpts(tail)
+    if len(chunk):
+        yield chunk
+
+def iterGPX(filename):
+    """Generate the trackpoints of a GPX file one at a time
+
+    for lat,lon,el,t in iterGPX(filename): ...
+
+    Input: filename = GPX file to read
+    Output: lat,lon = position (degrees)
+            el      = elevation (meters), NaN if missing
+            t       = time (seconds since 1970-01-01 UTC), NaN if missing"""
+
+    for chunk in iterGPXChunks(filename):
+        for row in chunk.tolist():
+            yield tuple(row)
 
 def readGPX(filename):
     """Read a GPS track in GPX format
@@ -19,91 +256,34 @@ def readGPX(filename):
     lats,lons,els,ts=readGPX(filename)
 
     Input: filename = GPX file to read
-    Output: lats = list of latitudes in track (degrees)
-            lons = list of longitudes in track (degrees)
-            els  = list of elevations in track (meters)
-            ts   = list of times in track (seconds)"""
-
-    # Format of the file we're interested amounts to three lines per sample
-    # first with lat, lon, then elevation, followed by timestamp
-
-    lats=[]
-    lons=[]
-    els=[]
-    ts=[]
-
-    # Open the file
-    fy = open(filename,'r')
-    data=""
-    for line in fy:
-        data=data+line
-    fy.close()
-
-    data2 = re.sub("\n","",data)
-    data3 = re.sub("<trkpt","\n<trkpt", data2)
-    data3 = re.sub("<ele","\n<ele", data3)
-    data3 = re.sub("<time", "\n<time", data3)
-    data3 = re.sub("Z</time", "</time", data3)
-    datalines = re.split("\n", data3)
-
-    for line in datalines:
-        idx=0
-        if line.startswith('<trkp',idx):
-                    lats.append(float(line[line.find('lat='):].replace('=',' ').replace('\"',' ').split()[1]))
-                    lons.append(float(line[line.find('lon='):].replace('=',' ').replace('\"',' ').split()[1]))
-        elif line.startswith('<ele>',idx):
-                    els.append(float(line[idx+5:].replace('<',' ').split()[0]))
-        elif line.startswith('<time',idx):
-                    a=line[line.find('T')+1:].replace(':',' ').replace('<',' ').split()
-                    ts.append(float(a[0])*3600+float(a[1])*60+float(a[2]))
-    return (np.array(lats),np.array(lons),np.array(els),np.array(ts))
-
-
-# 3D plot of lat vs lon vs time
-df = readGPX('gpstrack.gpx')
-
-fig = plt.figure()
-ax = fig.gca(projection='3d')
-ax.set_xlabel('Latitude')
-ax.set_ylabel('Longitude')
-ax.set_zlabel('Time')
-lats = df[0]
-lons = df[1]
-el = df[2]
-ts = df[3]
-ax.plot(lats, lons, ts)
-ax.legend()
-
-# 3d plot of lat vs lon vs elevation
-plt.show()
-
-fig = plt.figure()
-ax = fig.gca(projection='3d')
-ax.set_xlabel('Latitude')
-ax.set_ylabel('Longitude')
-ax.set_zlabel('Elevation')
-ax.plot(lats, lons, el)
-ax.legend()
-
-plt.show()
+    Output: lats = array of latitudes in track (degrees)
+            lons = array of longitudes in track (degrees)
+            els  = array of elevations in track (meters), NaN where missing
+            ts   = array of times in track (seconds since 1970-01-01 UTC),
+                   NaN where missing"""
+
+    chunks = list(iterGPXChunks(filename))
+    if not chunks:
+        return (np.empty(0), np.empty(0), np.empty(0), np.empty(0))
 
+    # Copy each column out contiguously so callers get plain 1-d arrays
+    points = np.concatenate(chunks) if len(chunks) > 1 else chunks[0]
+    del chunks
+    return tuple(np.ascontiguousarray(points[:, i]) for i in range(4))
 
 
 def stepsize(lat1, long1, lat2, long2):
     """Compute distance between two lat/lon pairs in miles.
     Use the haversine formula explained at
     https://www.movable-type.co.uk/scripts/latlong.html
+    Arrays of lat/lon pairs give an array of distances.
     """
-    lat1 = lat1 * pi/180
-    lat2 = lat2 * pi/180
-    dlat = (lat2 - lat1)
-    dlon = (long2 - long1) * pi/180
-    a = (sin(dlat/2))**2 + cos(lat1)*cos(lat2) * (sin(dlon/2))**2
-    c = 2 * atan2(sqrt(a), sqrt(1-a))
     R = 6371000 # Earth's radius in meters
-    d = R * c
 
-    return d / 1609 # Meters to miles conversion
+    return distance(lat1, long1, lat2, long2, R) / 1609 # Meters to miles conversion
+
+# The same function, under the name the array code uses
+stepsizes = stepsize
 
 def stepsize_feet(lat1, long1, lat2, long2):
     """Compute distance between two lat/lon pairs in feet.
@@ -125,21 +305,207 @@ def speedoverstep(lat1, long1, lat2, long2, ts1, ts2):
     return ss / dt
 
 
-lats, lons, els, ts = readGPX("gpstrack.gpx")
-
-
-# Takes GPX file as input and writes .csv as output
-cum_dist = 0
+# One row per trackpoint; the step columns describe the step from the
+# previous point and are 0 for the first one
+METRICS_DTYPE = np.dtype([('lat', 'f8'),       # degrees
+                          ('lon', 'f8'),       # degrees
+                          ('ele_ft', 'f8'),    # elevation, feet
+                          ('t', 'f8'),         # time, seconds
+                          ('step', 'f8'),      # step length, miles
+                          ('step_ft', 'f8'),   # step length, feet
+                          ('speed', 'f8'),     # speed over the step, miles per hour
+                          ('cum_dist', 'f8')]) # distance so far, miles
 
-f = open("output.csv", "w")
-f.write("0, "+str(lats[0])+", "+str(lons[0])+", "+str(3.28084*els[0])+", "+"0, "+"0, "+"0, "+"\n")
+def track_metrics(lats, lons, els, ts):
+    """Compute per-step distances and speeds along a whole track at once
 
-for i in range(1, len(lons)):
-    cum_dist += stepsize(lats[i-1], lons[i-1], lats[i], lons[i])
-    f.write(str(i)+", "+str(lats[i])+", "+str(lons[i])+", "+str(3.28084 * els[i])+", "+\
-    str(speedoverstep(lats[i-1], lons[i-1], lats[i], lons[i], ts[i-1], ts[i]))+", "+\
-    str(cum_dist)+", "+\
-    str(stepsize_feet(lats[i-1], lons[i-1], lats[i], lons[i]))+"\n")
+    m = track_metrics(lats, lons, els, ts)
 
+    Input: lats,lons,els,ts = arrays as returned by readGPX
+    Output: m = structured array of METRICS_DTYPE, one row per trackpoint
 
-f.close()
+    This is stepsize, stepsize_feet and speedoverstep applied to every
+    consecutive pair of points, with one haversine per step rather than
+    three, plus the running total distance."""
+
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    els = np.asarray(els, dtype=np.float64)
+    ts = np.asarray(ts, dtype=np.float64)
+
+    m = np.zeros(len(lats), dtype=METRICS_DTYPE)
+    m['lat'] = lats
+    m['lon'] = lons
+    m['ele_ft'] = 3.28084 * els
+    m['t'] = ts
+    if len(lats) < 2:
+        return m
+
+    step = stepsizes(lats[:-1], lons[:-1], lats[1:], lons[1:])
+
+    # Subtract the epoch seconds before scaling, so whole-second steps stay exact
+    dt = np.diff(ts) / 3600
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speed = step / dt
+
+    m['step'][1:] = step
+    m['step_ft'][1:] = step * 5280
+    m['speed'][1:] = speed
+    np.cumsum(step, out=m['cum_dist'][1:])
+    return m
+
+# Columns of the .csv output, in order, after the point index
+CSV_COLUMNS = ('lat', 'lon', 'ele_ft', 'speed', 'cum_dist', 'step_ft', 't')
+
+def write_csv(m, filename):
+    """Write track metrics to a .csv file
+
+    write_csv(m, filename)
+
+    Input: m        = structured array from track_metrics
+           filename = .csv file to write
+
+    The first line is a header naming the columns: the point index, then
+    CSV_COLUMNS. Floats are written in their shortest round-tripping
+    form, and the whole table goes out in one buffered write."""
+
+    cols = [m[name].tolist() for name in CSV_COLUMNS]
+    row = ', '.join(['%d'] + ['%r'] * len(CSV_COLUMNS)) + '\n'
+    with open(filename, 'w') as f:
+        f.write(', '.join(('index',) + CSV_COLUMNS) + '\n')
+        f.writelines([row % r for r in zip(range(len(m)), *cols)])
+
+def write_npy(m, filename):
+    """Write track metrics as a single .npy record array, which
+    load_track can memory-map"""
+    np.save(filename, m, allow_pickle=False)
+
+def write_npz(m, filename):
+    """Write track metrics as one .npz entry per column"""
+    np.savez(filename, **{name: m[name] for name in m.dtype.names})
+
+# Output formats by file extension
+WRITERS = {'.csv': write_csv, '.npy': write_npy, '.npz': write_npz}
+
+def write_track(m, filename):
+    """Write track metrics in the format given by the file's extension
+
+    write_track(m, filename)
+
+    Input: m        = structured array from track_metrics
+           filename = output file, ending in one of the keys of WRITERS"""
+
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in WRITERS:
+        raise ValueError("can't write %r: extension must be one of %s" % (filename, ', '.join(WRITERS)))
+    WRITERS[ext](m, filename)
+
+def load_track(filename, mmap_mode='r'):
+    """Load track metrics written by write_track
+
+    m = load_track(filename)
+
+    Input: filename  = .npy, .npz or .csv file from write_track
+           mmap_mode = passed to np.load for .npy files; None reads the
+                       whole file into memory
+    Output: m = structured array of METRICS_DTYPE
+
+    A .npy file is memory-mapped, so opening even a very long track is
+    immediate and pages are only read as columns are used. A .csv file
+    without write_csv's header line, such as one in the older headerless
+    7-column layout, raises ValueError."""
+
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == '.npy':
+        return np.load(filename, mmap_mode=mmap_mode, allow_pickle=False)
+
+    if ext == '.npz':
+        with np.load(filename, allow_pickle=False) as cols:
+            m = np.zeros(len(cols['lat']), dtype=METRICS_DTYPE)
+            for name in METRICS_DTYPE.names:
+                m[name] = cols[name]
+        return m
+    if ext == '.csv':
+        header = ', '.join(('index',) + CSV_COLUMNS)
+        with open(filename) as f:
+            first = f.readline().strip()
+            if first != header:
+                raise ValueError("can't load %r: expected a .csv from write_csv, whose first line is %r, not %r"
+                                 % (filename, header, first[:80]))
+            table = np.loadtxt(f, delimiter=',', ndmin=2)
+        if table.size and table.shape[1] != len(CSV_COLUMNS) + 1:
+            raise ValueError("can't load %r: rows have %d columns, not %d"
+                             % (filename, table.shape[1], len(CSV_COLUMNS) + 1))
+        m = np.zeros(len(table), dtype=METRICS_DTYPE)
+        for i, name in enumerate(CSV_COLUMNS):
+            m[name] = table[:, i + 1]
+        # The csv only has the step in feet
+        m['step'] = m['step_ft'] / 5280
+        return m
+    raise ValueError("can't load %r: extension must be one of %s" % (filename, ', '.join(WRITERS)))
+
+
+def plot_track(lats, lons, zs, zlabel, show=True, max_points=20000, source=None):
+    """3D plot of a track against a third quantity
+
+    ax = plot_track(lats, lons, zs, zlabel)
+
+    Input: lats,lons  = track positions (degrees)
+           zs         = values to plot on the vertical axis
+           zlabel     = label for the vertical axis
+           show       = call plt.show() before returning
+           max_points = long tracks are simplified to about this many
+                        points before plotting; None plots every point
+           source     = GPX file the track was read from, so its levels
+                        of detail can be cached next to it
+    Output: ax = the 3D axes plotted on
+
+    matplotlib is imported here rather than with the module, so code that
+    only reads and measures tracks never pays for it."""
+
+    import matplotlib.pyplot as plt
+
+    lats = np.asarray(lats)
+    lons = np.asarray(lons)
+    zs = np.asarray(zs)
+    if max_points is not None and len(lats) > max_points:
+        from simplify import plot_indices
+        keep = plot_indices(lats, lons, zs, max_points, source)
+        lats, lons, zs = lats[keep], lons[keep], zs[keep]
+
+    fig = plt.figure()
+    ax = fig.add_subplot(projection='3d')
+    ax.set_xlabel('Latitude')
+    ax.set_ylabel('Longitude')
+    ax.set_zlabel(zlabel)
+    ax.plot(lats, lons, zs, label=zlabel)
+    ax.legend()
+
+    if show:
+        plt.show()
+    return ax
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Plot a GPX track and write its distances and speeds.')
+    parser.add_argument('gpx', nargs='?', default='gpstrack.gpx', help='GPX file to read')
+    parser.add_argument('-o', '--output', default='output.csv',
+                        help='where to write the metrics; the extension picks the format (%s)'
+                        % ', '.join(WRITERS))
+    parser.add_argument('--no-plot', action='store_true', help="don't show the 3D plots")
+    args = parser.parse_args(argv)
+
+    lats, lons, els, ts = readGPX(args.gpx)
+
+    if not args.no_plot:
+        # 3D plot of lat vs lon vs time, then lat vs lon vs elevation
+        plot_track(lats, lons, ts, 'Time', source=args.gpx)
+        plot_track(lats, lons, els, 'Elevation', source=args.gpx)
+
+    # Takes GPX file as input and writes .csv as output
+    write_track(track_metrics(lats, lons, els, ts), args.output)
+
+
+if __name__ == "__main__":
+    main()
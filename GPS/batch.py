@@ -0,0 +1,189 @@
+#!/bin/python
+# Process whole directories of GPX tracks with Project1_GPS
+#
+# Every track is parsed and turned into per-point metrics in a process
+# pool, written next to the others in one output directory, and summed up
+# in a single summary table. Tracks whose output is already newer than the
+# .gpx are not parsed again.
+#
+# Usage: python batch.py ~/tracks/2020-08 'archive/*.gpx' -o processed \
+#            --format .npy --workers 8
+
+import argparse
+import glob
+import os
+import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from Project1_GPS import WRITERS, load_track, readGPX, track_metrics, write_track
+
+# One row of the summary table
+TrackSummary = namedtuple('TrackSummary', ['track', 'points', 'distance', 'duration',
+                                           'max_speed', 'ele_gain', 'skipped'])
+
+SUMMARY_HEADER = 'track, points, distance_mi, duration_s, max_speed_mph, ele_gain_ft, skipped'
+
+def find_tracks(patterns):
+    """List the .gpx files named by a sequence of directories, files and globs
+
+    paths = find_tracks(patterns)
+
+    Input: patterns = directories (every .gpx directly inside is used),
+                      file names, or glob patterns
+    Output: paths = sorted list of distinct .gpx paths"""
+
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths.update(glob.glob(os.path.join(pattern, '*.gpx')))
+        else:
+            paths.update(p for p in glob.glob(pattern) if os.path.isfile(p))
+    return sorted(paths)
+
+def output_path(src, outdir, ext):
+    return os.path.join(outdir, os.path.splitext(os.path.basename(src))[0] + ext)
+
+def up_to_date(src, dst):
+    """True if dst exists and was written after src was last modified"""
+    try:
+        return os.path.getmtime(dst) >= os.path.getmtime(src)
+    except OSError:
+        return False
+
+def summarize(name, m, skipped=False):
+    """Sum up the metrics of one track
+
+    s = summarize(name, m)
+
+    Input: name = label for the track
+           m    = structured array from track_metrics
+    Output: s = TrackSummary with total distance (miles), duration
+                (seconds), fastest step (mph, ignoring steps with no
+                elapsed time) and total climb (feet)"""
+
+    if len(m) == 0:
+        return TrackSummary(name, 0, 0.0, 0.0, np.nan, 0.0, skipped)
+
+    speed = m['speed'][1:]
+    speed = speed[np.isfinite(speed)]
+    climb = np.diff(m['ele_ft'])
+    return TrackSummary(name, len(m), float(m['cum_dist'][-1]), float(np.nanmax(m['t']) - np.nanmin(m['t'])),
+                        float(speed.max()) if len(speed) else np.nan,
+                        float(np.nansum(climb[climb > 0])), skipped)
+
+def process_track(src, dst, force=False):
+    """Turn one .gpx file into a metrics file and summarize it
+
+    s = process_track(src, dst)
+
+    Input: src   = .gpx file to read
+           dst   = output file; its extension picks the format
+           force = reprocess even if dst is newer than src
+    Output: s = TrackSummary of the track
+
+    Raises ValueError if src has no trackpoints (e.g. it isn't GPX)."""
+
+    name = os.path.splitext(os.path.basename(src))[0]
+    if not force and up_to_date(src, dst):
+        return summarize(name, load_track(dst), skipped=True)
+
+    lats, lons, els, ts = readGPX(src)
+    if not len(lats):
+        raise ValueError('no trackpoints in %s' % src)
+    m = track_metrics(lats, lons, els, ts)
+    # Write to a temporary name first so an interrupted run never leaves
+    # a truncated file that looks up to date
+    root, ext = os.path.splitext(dst)
+    tmp = root + '.partial' + ext
+    write_track(m, tmp)
+    os.replace(tmp, dst)
+    return summarize(name, m)
+
+def _process(job):
+    src, dst, force = job
+    try:
+        return process_track(src, dst, force), None
+    except Exception as e:
+        return None, '%s: %s: %s' % (src, type(e).__name__, e)
+
+def write_summary(rows, filename):
+    """Write TrackSummary rows as a .csv table"""
+    with open(filename, 'w') as f:
+        f.write(SUMMARY_HEADER + '\n')
+        f.writelines('%s, %d, %r, %r, %r, %r, %d\n' % tuple(row) for row in rows)
+
+def process_tracks(paths, outdir, ext='.npy', workers=None, force=False, summary='summary.csv'):
+    """Process many .gpx files in parallel
+
+    rows, errors = process_tracks(paths, outdir)
+
+    Input: paths   = .gpx files to process
+           outdir  = directory for the per-track outputs and the summary
+           ext     = output format, one of the keys of Project1_GPS.WRITERS
+           workers = size of the process pool; None uses every core and 1
+                     processes serially in this process
+           force   = reprocess tracks even if their outputs are up to date
+           summary = file name of the summary table inside outdir, or None
+    Output: rows   = TrackSummary for every track that was processed or
+                     skipped, in the order of paths
+            errors = messages for tracks that could not be read
+
+    A bad file doesn't stop the batch; it is left out of the summary and
+    reported in errors."""
+
+    if ext not in WRITERS:
+        raise ValueError("ext must be one of %s, not %r" % (', '.join(WRITERS), ext))
+
+    # Outputs are named after the track, so two tracks with the same name
+    # would overwrite each other
+    seen = {}
+    for src in paths:
+        dst = output_path(src, outdir, ext)
+        if dst in seen:
+            raise ValueError('%s and %s would both write %s' % (seen[dst], src, dst))
+        seen[dst] = src
+
+    os.makedirs(outdir, exist_ok=True)
+    jobs = [(src, output_path(src, outdir, ext), force) for src in paths]
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(jobs))
+
+    if workers <= 1:
+        results = [_process(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(_process, jobs, chunksize=max(1, len(jobs) // (4 * workers))))
+
+    rows = [row for row, error in results if row is not None]
+    errors = [error for row, error in results if error is not None]
+    if summary:
+        write_summary(rows, os.path.join(outdir, summary))
+    return rows, errors
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compute distance and speed for many GPX tracks.')
+    parser.add_argument('inputs', nargs='+', help='.gpx files, directories of them, or glob patterns')
+    parser.add_argument('-o', '--outdir', default='processed', help='where to write the outputs')
+    parser.add_argument('--format', choices=sorted(WRITERS), default='.npy', help='per-track output format')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--force', action='store_true', help='reprocess tracks that are up to date')
+    parser.add_argument('--summary', default='summary.csv', help='summary table file name in OUTDIR')
+    args = parser.parse_args(argv)
+
+    paths = find_tracks(args.inputs)
+    rows, errors = process_tracks(paths, args.outdir, args.format, args.workers, args.force, args.summary)
+
+    skipped = sum(row.skipped for row in rows)
+    print('%d track(s): %d processed, %d up to date, %d failed'
+          % (len(paths), len(rows) - skipped, skipped, len(errors)))
+    for error in errors:
+        print(error, file=sys.stderr)
+    return 1 if errors else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,289 @@
+#!/bin/python
+# Track simplification and level-of-detail selection for plotting
+#
+# douglas_peucker drops the points of a track that lie within a tolerance
+# (in feet) of the simplified path, and minmax_downsample keeps the lowest
+# and highest value of a series in every bucket. levels_of_detail stacks
+# Douglas-Peucker at growing tolerances, working down from the coarsest,
+# and cached_levels keeps that stack in a small file next to the GPX file
+# it came from.
+
+import importlib.util
+import os
+import sys
+
+import numpy as np
+
+# greatcircle lives in ../shared; put that on the path unless it's already importable
+if importlib.util.find_spec('greatcircle') is None:
+    sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'shared'))
+from greatcircle import R_M as R
+
+# Tolerances (feet) of the precomputed levels of detail, finest first
+LOD_TOLERANCES = (1.0, 4.0, 16.0, 64.0, 256.0, 1024.0)
+
+def unit_vectors(lats, lons):
+    """Points (degrees) as x, y, z arrays of unit vectors from the earth's center"""
+    lat = np.radians(lats)
+    lon = np.radians(lons)
+    return np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)
+
+def _cross_track(p, a, b):
+    """Angle from unit vectors p to the great circle through unit vectors a and b
+
+    Where a and b coincide, this is the angle from p to a."""
+
+    nx = a[1] * b[2] - a[2] * b[1]
+    ny = a[2] * b[0] - a[0] * b[2]
+    nz = a[0] * b[1] - a[1] * b[0]
+    norm = np.sqrt(nx * nx + ny * ny + nz * nz)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        xt = np.arcsin(np.minimum(np.abs(p[0] * nx + p[1] * ny + p[2] * nz) / norm, 1.0))
+    # Where a == b there is no circle; the angle to a, from the chord to it
+    dx, dy, dz = p[0] - a[0], p[1] - a[1], p[2] - a[2]
+    return np.where(norm > 0, xt, 2 * np.arcsin(np.minimum(0.5 * np.sqrt(dx * dx + dy * dy + dz * dz), 1.0)))
+
+def cross_track_feet(lats, lons, lat1, lon1, lat2, lon2):
+    """Distance in feet from points to the great circle through points 1 and 2
+
+    Where points 1 and 2 coincide, this is the distance to point 1."""
+
+    return (_cross_track(unit_vectors(lats, lons), unit_vectors(lat1, lon1), unit_vectors(lat2, lon2))
+            * R * 3.28084)
+
+def douglas_peucker(lats, lons, tolerance, coarser=None, max_points=None):
+    """Simplify a track with the Douglas-Peucker algorithm
+
+    keep = douglas_peucker(lats, lons, tolerance)
+
+    Input: lats,lons = track positions (degrees)
+           tolerance = largest distance (feet) a dropped point may lie
+                       from the simplified track
+           coarser   = optional result of douglas_peucker at a larger
+                       tolerance, to refine rather than start over
+           max_points = optional; give up once more points than this
+                        are kept
+    Output: keep = sorted indices of the points to keep; always includes
+                   the first and last point. None if max_points was
+                   exceeded
+
+    Instead of recursing one segment at a time, every open segment is
+    split in the same pass: each pass measures all remaining points
+    against their segment and keeps the farthest point of every segment
+    that is still too far off. Segments that are within tolerance are
+    settled and never looked at again, so a pass only touches the points
+    that are still undecided.
+
+    A segment is only ever split at its farthest point, so the points
+    kept at a larger tolerance are all kept at a smaller one too, and
+    passing them as coarser picks up where that run stopped."""
+
+    n = len(lats)
+    if n <= 2:
+        return np.arange(n)
+    xyz = unit_vectors(np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64))
+    tolerance = tolerance / (R * 3.28084) # as an angle
+
+    kept = np.zeros(n, dtype=bool)
+    kept[0] = kept[-1] = True
+    if coarser is not None:
+        kept[coarser] = True
+    count = np.count_nonzero(kept)
+    todo = np.flatnonzero(~kept)  # points not kept and not settled
+
+    while len(todo):
+        anchors = np.flatnonzero(kept)
+        seg = np.searchsorted(anchors, todo) - 1
+        start = anchors[seg]
+        end = anchors[seg + 1]
+        d = _cross_track([v[todo] for v in xyz], [v[start] for v in xyz], [v[end] for v in xyz])
+
+        # todo is sorted, so each segment's points are one run
+        first = np.flatnonzero(np.r_[True, seg[1:] != seg[:-1]])
+        worst = np.maximum.reduceat(d, first)
+        run = np.repeat(np.arange(len(first)), np.diff(np.r_[first, len(todo)]))
+        split = worst > tolerance
+
+        # The farthest point of each segment still out of tolerance
+        at_worst = np.flatnonzero((d == worst[run]) & split[run])
+        runs, pick = np.unique(run[at_worst], return_index=True)
+        kept[todo[at_worst[pick]]] = True
+        count += len(pick)
+        if max_points is not None and count > max_points:
+            return None
+
+        # Keep working on the points of segments that were split
+        todo = todo[split[run] & ~kept[todo]]
+
+    return np.flatnonzero(kept)
+
+def minmax_downsample(values, buckets):
+    """Keep the smallest and largest value of each of a number of buckets
+
+    keep = minmax_downsample(values, buckets)
+
+    Input: values  = series to thin out, e.g. elevations
+           buckets = number of equal runs of points to split it into
+    Output: keep = sorted indices of the points to keep, at most
+                   2*buckets + 2 of them, including the first and last
+
+    The shape of the series, peaks and dips included, survives even when
+    most of the points are dropped. NaN values are ignored."""
+
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if n <= 2 * buckets + 2:
+        return np.arange(n)
+
+    edges = np.linspace(0, n, buckets + 1).astype(np.intp)
+    lo = np.where(np.isnan(values), np.inf, values)
+    hi = np.where(np.isnan(values), -np.inf, values)
+    sizes = np.diff(edges)
+    run = np.repeat(np.arange(buckets), sizes)
+
+    # Index of the first min and max within each bucket
+    at_min = np.flatnonzero(lo == np.minimum.reduceat(lo, edges[:-1])[run])
+    at_max = np.flatnonzero(hi == np.maximum.reduceat(hi, edges[:-1])[run])
+    mins = at_min[np.unique(run[at_min], return_index=True)[1]]
+    maxs = at_max[np.unique(run[at_max], return_index=True)[1]]
+    return np.unique(np.concatenate(([0, n - 1], mins, maxs)))
+
+def thin(lats, lons, feet):
+    """Drop the points that add nothing at a given scale
+
+    keep = thin(lats, lons, feet)
+
+    Input: lats,lons = track positions (degrees)
+           feet      = width of the grid squares to thin by
+    Output: keep = sorted indices of the first and last point of each
+                   run of consecutive points in the same grid square,
+                   including the first and last point of the track
+
+    Every dropped point lies in a square with a kept one, within
+    1.5*feet of it. This is one pass over the track, so it is a cheap
+    way to shrink a long, densely sampled track before simplifying it."""
+
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    n = len(lats)
+    if n <= 2:
+        return np.arange(n)
+
+    scale = R * 3.28084 / feet # grid squares per radian
+    y = np.floor(np.radians(lats) * scale)
+    x = np.floor(np.radians(lons) * np.cos(np.radians(lats)) * scale)
+    change = np.r_[True, (x[1:] != x[:-1]) | (y[1:] != y[:-1]), True]
+    return np.flatnonzero(change[:-1] | change[1:])
+
+def levels_of_detail(lats, lons, tolerances=LOD_TOLERANCES, max_points=None):
+    """Douglas-Peucker simplifications at a series of growing tolerances
+
+    levels = levels_of_detail(lats, lons)
+
+    Input: lats,lons  = track positions (degrees)
+           tolerances = increasing tolerances (feet)
+           max_points = optional; stop at the first level with more
+                        points than this
+    Output: levels = list of index arrays for the coarsest tolerances,
+                     finest first: one per tolerance, or with max_points
+                     only those that fit in it (always the coarsest)
+
+    The levels are built coarsest first, each one refining the level
+    above it (see douglas_peucker), so the fine levels, which cost the
+    most, are only computed as far as they are wanted. Each level is
+    computed on the track thinned to an eighth of its tolerance (see
+    thin), so no point ends up more than about 1.2 times the tolerance
+    from the simplified track."""
+
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    levels = []
+    for tol in tolerances[::-1]:
+        idx = thin(lats, lons, tol / 8)
+        coarser = None
+        if levels:
+            mask = np.zeros(len(lats), dtype=bool)
+            mask[idx] = True
+            mask[levels[-1]] = True
+            idx = np.flatnonzero(mask)
+            coarser = np.searchsorted(idx, levels[-1])
+        keep = douglas_peucker(lats[idx], lons[idx], tol, coarser, max_points if levels else None)
+        if keep is None:
+            break
+        levels.append(idx[keep])
+    return levels[::-1]
+
+def cache_path(source):
+    """Where the levels of detail of a GPX file are cached"""
+    return os.path.splitext(source)[0] + '.lod.npz'
+
+def cached_levels(source, lats, lons, tolerances=LOD_TOLERANCES, max_points=None):
+    """levels_of_detail for the track read from source, cached next to it
+
+    levels = cached_levels(source, lats, lons)
+
+    The cache file is reused while it is newer than source and was built
+    with the same tolerances and number of points, and with every level
+    or at least as large a max_points; it is rebuilt otherwise. A cache
+    that can't be written (read-only directory) is skipped."""
+
+    path = cache_path(source)
+    limit = np.inf if max_points is None else max_points
+    try:
+        if os.path.getmtime(path) >= os.path.getmtime(source):
+            with np.load(path, allow_pickle=False) as f:
+                if (int(f['points']) == len(lats) and float(f['max_points']) >= limit and
+                        np.array_equal(f['tolerances'], np.asarray(tolerances, dtype=np.float64))):
+                    return np.split(f['indices'], f['offsets'][1:-1])
+    except (OSError, KeyError, ValueError):
+        pass
+
+    levels = levels_of_detail(lats, lons, tolerances, max_points)
+    offsets = np.cumsum([0] + [len(level) for level in levels])
+    complete = len(levels) == len(tolerances)
+    try:
+        np.savez(path, points=len(lats), tolerances=np.asarray(tolerances, dtype=np.float64),
+                 max_points=np.inf if complete else limit,
+                 offsets=offsets, indices=np.concatenate(levels))
+    except OSError:
+        pass
+    return levels
+
+def choose_level(levels, max_points):
+    """The finest level with at most max_points points, else the coarsest"""
+    for level in levels:
+        if len(level) <= max_points:
+            return level
+    return levels[-1]
+
+def plot_indices(lats, lons, zs, max_points=20000, source=None):
+    """Pick which points of a track to plot
+
+    keep = plot_indices(lats, lons, zs, max_points)
+
+    Input: lats,lons  = track positions (degrees)
+           zs         = values on the plot's third axis
+           max_points = roughly how many points to plot at most
+           source     = GPX file the track came from, to cache the
+                        levels of detail next to it; None skips the cache
+    Output: keep = sorted indices of the points to plot
+
+    Short tracks are plotted whole. Otherwise half the budget goes to the
+    finest Douglas-Peucker level that fits, for the shape of the path,
+    and half to a min/max downsample of zs, so spikes in the third
+    coordinate are not flattened away. Levels are only computed down to
+    the first one that doesn't fit."""
+
+    n = len(lats)
+    if n <= max_points:
+        return np.arange(n)
+
+    if source is not None:
+        levels = cached_levels(source, lats, lons, max_points=max_points // 2)
+    else:
+        levels = levels_of_detail(lats, lons, max_points=max_points // 2)
+
+    path = choose_level(levels, max_points // 2)
+    if len(path) > max_points // 2:
+        path = path[np.linspace(0, len(path) - 1, max_points // 2).astype(np.intp)]
+    return np.union1d(path, minmax_downsample(zs, max(1, max_points // 4 - 1)))
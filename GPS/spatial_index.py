@@ -0,0 +1,238 @@
+#!/bin/python
+# A persistent spatial index over the trackpoints of many GPX tracks
+#
+# Points are bucketed into a regular latitude/longitude grid and kept
+# sorted by cell, so every row of cells a query touches is one contiguous
+# slice found with searchsorted. The candidates in those slices are then
+# checked exactly (great-circle distance or box bounds).
+#
+# Usage: python spatial_index.py library.npz --add ~/tracks/2020-08 \
+#            --near 38.93 -77.07 50 --bbox 38.9 39.0 -77.1 -77.0
+
+import argparse
+import importlib.util
+import os
+import sys
+from math import *
+
+import numpy as np
+
+# greatcircle lives in ../shared; put that on the path unless it's already importable
+if importlib.util.find_spec('greatcircle') is None:
+    sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'shared'))
+from Project1_GPS import readGPX
+from greatcircle import R_M as R, distance
+
+# Query results: which track, and which point of it (its position in the
+# arrays readGPX returned)
+HIT_DTYPE = np.dtype([('track', 'i4'), ('point', 'i8')])
+
+class TrackIndex:
+    """Grid-bucket index of (lat, lon) trackpoints from many tracks
+
+    index = TrackIndex(cell=0.005)
+    index.add('morning_run', lats, lons)
+    hits = index.near(38.93, -77.07, 50)
+
+    cell is the grid spacing in degrees. The default, about 550 m of
+    latitude, keeps both 10 m and few-km queries to a handful of cells.
+
+    Tracks can be added at any time; each insertion merges the new
+    points into the sorted arrays in linear time. Queries return
+    structured arrays of HIT_DTYPE, sorted by track and point, and
+    index.names[track] is the name a track was added under."""
+
+    def __init__(self, cell=0.005):
+        self.cell = float(cell)
+        self.nrows = int(ceil(180 / self.cell))
+        self.ncols = int(ceil(360 / self.cell))
+        self.names = []
+        self.keys = np.empty(0, dtype=np.int64)
+        self.lats = np.empty(0)
+        self.lons = np.empty(0)
+        self.tracks = np.empty(0, dtype=np.int32)
+        self.points = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def __repr__(self):
+        return 'TrackIndex(%d tracks, %d points, cell=%r)' % (len(self.names), len(self), self.cell)
+
+    def _rows(self, lats):
+        return np.clip(np.floor((np.asarray(lats) + 90) / self.cell).astype(np.int64), 0, self.nrows - 1)
+
+    def _cols(self, lons):
+        return np.floor((np.asarray(lons) + 180) / self.cell).astype(np.int64) % self.ncols
+
+    def add(self, name, lats, lons):
+        """Insert the points of one track; returns its track number
+
+        Points with a NaN coordinate are left out, but the others keep
+        their index in the original arrays."""
+
+        if name in self.names:
+            raise ValueError('track %r is already in the index' % (name,))
+
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        points = np.flatnonzero(np.isfinite(lats) & np.isfinite(lons))
+        keys = self._rows(lats[points]) * self.ncols + self._cols(lons[points])
+
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        points = points[order]
+        track = len(self.names)
+
+        # Merge into the sorted arrays; new points go after existing ones
+        # in the same cell, so the (track, point) order is kept within cells
+        at = np.searchsorted(self.keys, keys, side='right')
+        self.keys = np.insert(self.keys, at, keys)
+        self.lats = np.insert(self.lats, at, lats[points])
+        self.lons = np.insert(self.lons, at, lons[points])
+        self.tracks = np.insert(self.tracks, at, np.full(len(points), track, dtype=np.int32))
+        self.points = np.insert(self.points, at, points)
+        self.names.append(name)
+        return track
+
+    def add_gpx(self, filename, name=None):
+        """Read a GPX file and insert its track, named after the file by default"""
+        if name is None:
+            name = os.path.splitext(os.path.basename(filename))[0]
+        lats, lons, els, ts = readGPX(filename)
+        return self.add(name, lats, lons)
+
+    def _candidates(self, row0, row1, col0, col1):
+        """Positions of every point in rows row0..row1 and columns col0..col1;
+        columns may run past either end of the grid and wrap around"""
+
+        rows = np.arange(max(row0, 0), min(row1, self.nrows - 1) + 1)
+        if col1 - col0 + 1 >= self.ncols:
+            spans = [(0, self.ncols - 1)]
+        else:
+            col0 %= self.ncols
+            col1 %= self.ncols
+            spans = [(col0, col1)] if col0 <= col1 else [(col0, self.ncols - 1), (0, col1)]
+
+        starts = (rows[:, None] * self.ncols + [c0 for c0, c1 in spans]).ravel()
+        stops = (rows[:, None] * self.ncols + [c1 + 1 for c0, c1 in spans]).ravel()
+        lo = np.searchsorted(self.keys, starts)
+        hi = np.searchsorted(self.keys, stops)
+        return np.concatenate([np.arange(0, dtype=np.intp)] + [np.arange(a, b) for a, b in zip(lo, hi) if b > a])
+
+    def _hits(self, idx):
+        hits = np.empty(len(idx), dtype=HIT_DTYPE)
+        hits['track'] = self.tracks[idx]
+        hits['point'] = self.points[idx]
+        hits.sort(order=['track', 'point'])
+        return hits
+
+    def near(self, lat, lon, radius):
+        """Every point within radius meters of (lat, lon)
+
+        hits = index.near(lat, lon, radius)"""
+
+        dlat = degrees(radius / R)
+        row0, row1 = self._rows([lat - dlat, lat + dlat])
+
+        # Half-width in longitude of the circle; it covers every longitude
+        # once the circle reaches a pole
+        s = sin(radius / R) / cos(radians(lat)) if abs(lat) + dlat < 90 else 2
+        if s < 1:
+            dlon = degrees(asin(s))
+            col0 = int(floor((lon - dlon + 180) / self.cell))
+            col1 = int(floor((lon + dlon + 180) / self.cell))
+        else:
+            col0, col1 = 0, self.ncols - 1
+
+        idx = self._candidates(row0, row1, col0, col1)
+        idx = idx[distance(lat, lon, self.lats[idx], self.lons[idx]) <= radius]
+        return self._hits(idx)
+
+    def bbox(self, lat_min, lat_max, lon_min, lon_max):
+        """Every point with lat_min <= lat <= lat_max and lon_min <= lon <= lon_max
+
+        hits = index.bbox(lat_min, lat_max, lon_min, lon_max)
+
+        A box with lon_min > lon_max crosses the 180th meridian."""
+
+        row0, row1 = self._rows([lat_min, lat_max])
+        col0 = int(floor((lon_min + 180) / self.cell))
+        col1 = int(floor((lon_max + 180) / self.cell))
+        if lon_min > lon_max:
+            col1 += self.ncols
+
+        idx = self._candidates(row0, row1, col0, col1)
+        lats = self.lats[idx]
+        lons = self.lons[idx]
+        inside = (lats >= lat_min) & (lats <= lat_max)
+        if lon_min <= lon_max:
+            inside &= (lons >= lon_min) & (lons <= lon_max)
+        else:
+            inside &= (lons >= lon_min) | (lons <= lon_max)
+        return self._hits(idx[inside])
+
+    def tracks_near(self, lat, lon, radius):
+        """Names of the tracks that passed within radius meters of (lat, lon)"""
+        return [self.names[t] for t in np.unique(self.near(lat, lon, radius)['track'])]
+
+    def save(self, filename):
+        """Write the index to an uncompressed .npz file, under exactly
+        this name (np.savez would add .npz to any other)"""
+        with open(filename, 'wb') as f:
+            np.savez(f, cell=self.cell, names=np.array(self.names, dtype=str), keys=self.keys,
+                     lats=self.lats, lons=self.lons, tracks=self.tracks, points=self.points)
+
+    @classmethod
+    def load(cls, filename):
+        """Read an index written by save
+
+        The arrays are stored already sorted, so loading is a straight
+        read with nothing to rebuild."""
+
+        with np.load(filename, allow_pickle=False) as f:
+            index = cls(float(f['cell']))
+            index.names = f['names'].tolist()
+            for name in ('keys', 'lats', 'lons', 'tracks', 'points'):
+                setattr(index, name, f[name])
+        return index
+
+def main(argv=None):
+    from batch import find_tracks
+
+    parser = argparse.ArgumentParser(description='Build and query a spatial index of GPX tracks.')
+    parser.add_argument('index', help='.npz index file; created if missing')
+    parser.add_argument('--add', nargs='+', default=[], metavar='GPX',
+                        help='.gpx files, directories or globs to add; tracks already indexed are skipped')
+    parser.add_argument('--cell', type=float, default=0.005, help='grid spacing of a new index (degrees)')
+    parser.add_argument('--near', type=float, nargs=3, metavar=('LAT', 'LON', 'METERS'),
+                        help='list the tracks that passed within METERS of LAT, LON')
+    parser.add_argument('--bbox', type=float, nargs=4, metavar=('LAT_MIN', 'LAT_MAX', 'LON_MIN', 'LON_MAX'),
+                        help='count the points of each track inside a box')
+    args = parser.parse_args(argv)
+
+    index = TrackIndex.load(args.index) if os.path.exists(args.index) else TrackIndex(args.cell)
+    added = 0
+    for path in find_tracks(args.add):
+        if os.path.splitext(os.path.basename(path))[0] not in index:
+            index.add_gpx(path)
+            added += 1
+    if added or not os.path.exists(args.index):
+        index.save(args.index)
+    print(index)
+
+    if args.near:
+        for name in index.tracks_near(*args.near):
+            print(name)
+    if args.bbox:
+        hits = index.bbox(*args.bbox)
+        tracks, counts = np.unique(hits['track'], return_counts=True)
+        for t, n in zip(tracks, counts):
+            print('%s: %d points' % (index.names[t], n))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,161 @@
+#!/bin/python
+# Tests for the GPX reader in Project1_GPS
+#
+# Usage: python -m unittest test_Project1_GPS   (from the GPS directory)
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+from Project1_GPS import iterGPXChunks, load_track, parse_iso8601, readGPX, track_metrics, write_track
+
+HEADER = ('<?xml version="1.0" encoding="utf-8"?>\n'
+          '<gpx xmlns="http://www.topografix.com/GPX/1/1" version="1.1"><trk><trkseg>\n')
+FOOTER = '</trkseg></trk></gpx>\n'
+
+# 2020-08-30T05:10:05Z and one second later, as epoch seconds
+T0 = 1598764205.0
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def run_clean(code, cwd, path=None):
+    """Run code in a fresh interpreter with only `path` on PYTHONPATH"""
+    env = {k: v for k, v in os.environ.items() if k != 'PYTHONPATH'}
+    if path:
+        env['PYTHONPATH'] = path
+    return subprocess.run([sys.executable, '-c', code], cwd=cwd, env=env,
+                          capture_output=True, text=True)
+
+class ImportAnywhere(unittest.TestCase):
+    """The modules find ../shared themselves, wherever they're imported from"""
+
+    def test_import(self):
+        for module in ('Project1_GPS', 'batch', 'simplify', 'spatial_index'):
+            for cwd, path in ((HERE, None), (tempfile.gettempdir(), HERE)):
+                with self.subTest(module=module, cwd=cwd):
+                    done = run_clean('import ' + module, cwd, path)
+                    self.assertEqual(done.returncode, 0, done.stderr)
+
+    def test_no_matplotlib(self):
+        # Plotting is the only thing that needs matplotlib, so importing the
+        # module (and reading a track) must not load it
+        done = run_clean('import sys\n'
+                         'import Project1_GPS\n'
+                         'Project1_GPS.readGPX("gpstrack.gpx")\n'
+                         'print(sorted(m for m in sys.modules if m.split(".")[0] == "matplotlib"))',
+                         HERE)
+        self.assertEqual(done.returncode, 0, done.stderr)
+        self.assertEqual(done.stdout.strip(), '[]')
+
+class ReadGPXLayouts(unittest.TestCase):
+    """Every trackpoint layout gives the same numbers as the plain one"""
+
+    def read(self, points):
+        with tempfile.NamedTemporaryFile('w', suffix='.gpx', delete=False) as f:
+            f.write(HEADER + ''.join(points) + FOOTER)
+        try:
+            return np.column_stack(readGPX(f.name))
+        finally:
+            os.remove(f.name)
+
+    def check(self, points, expected):
+        got = self.read(points)
+        np.testing.assert_array_equal(got, np.array(expected, dtype=np.float64))
+
+    def test_plain(self):
+        self.check(['<trkpt lat="38.9" lon="-77.1"><ele>90.5</ele><time>2020-08-30T05:10:05Z</time></trkpt>\n',
+                    '<trkpt lat="38.8" lon="-77.0"><ele>91</ele><time>2020-08-30T05:10:06Z</time></trkpt>\n'],
+                   [[38.9, -77.1, 90.5, T0], [38.8, -77.0, 91, T0 + 1]])
+
+    def test_time_before_ele(self):
+        self.check(['<trkpt lat="38.9" lon="-77.1"><time>2020-08-30T05:10:05Z</time><ele>90.5</ele></trkpt>\n',
+                    '<trkpt lat="38.8" lon="-77.0"><ele>91</ele><time>2020-08-30T05:10:06Z</time></trkpt>\n'],
+                   [[38.9, -77.1, 90.5, T0], [38.8, -77.0, 91, T0 + 1]])
+
+    def test_other_children_first(self):
+        self.check(['<trkpt lat="38.9" lon="-77.1"><name>a</name><ele>90.5</ele>'
+                    '<time>2020-08-30T05:10:05Z</time></trkpt>\n',
+                    '<trkpt lat="38.8" lon="-77.0"><extensions><speed>1</speed></extensions>'
+                    '<time>2020-08-30T05:10:06Z</time><ele>91</ele></trkpt>\n'],
+                   [[38.9, -77.1, 90.5, T0], [38.8, -77.0, 91, T0 + 1]])
+
+    def test_missing_children(self):
+        self.check(['<trkpt lat="38.9" lon="-77.1"><time>2020-08-30T05:10:05Z</time></trkpt>\n',
+                    '<trkpt lat="38.8" lon="-77.0"><ele>91</ele></trkpt>\n',
+                    '<trkpt lat="38.7" lon="-76.9"/>\n'],
+                   [[38.9, -77.1, np.nan, T0], [38.8, -77.0, 91, np.nan], [38.7, -76.9, np.nan, np.nan]])
+
+    def test_mixed_layouts_across_blocks(self):
+        plain = '<trkpt lat="38.9" lon="-77.1"><ele>90.5</ele><time>2020-08-30T05:10:05Z</time></trkpt>\n'
+        odd = '<trkpt lat="38.9" lon="-77.1"><time>2020-08-30T05:10:05Z</time><ele>90.5</ele></trkpt>\n'
+        points = [plain] * 500 + [odd] + [plain] * 500
+        with tempfile.NamedTemporaryFile('w', suffix='.gpx', delete=False) as f:
+            f.write(HEADER + ''.join(points) + FOOTER)
+        try:
+            got = np.concatenate(list(iterGPXChunks(f.name, blocksize=4096)))
+        finally:
+            os.remove(f.name)
+        np.testing.assert_array_equal(got, np.tile([38.9, -77.1, 90.5, T0], (1001, 1)))
+
+class ParseISO8601(unittest.TestCase):
+    """Timestamps parse to epoch seconds, and anything malformed to NaN"""
+
+    def check(self, stamps, expected):
+        np.testing.assert_array_equal(parse_iso8601(stamps), np.array(expected, dtype=np.float64))
+
+    def test_forms(self):
+        self.check(['2020-08-30T05:10:05Z', '2020-08-30 05:10:05', ' 2020-08-30T05:10:05Z\n',
+                    '2020-08-30T01:10:05-04:00', '2020-08-30T01:10:05-0400', '2020-08-30T01:10:05-04'],
+                   [T0] * 6)
+        self.assertAlmostEqual(parse_iso8601(['2020-08-30T05:10:05.908Z'])[0], T0 + 0.908, places=6)
+
+    def test_trailing_junk(self):
+        self.check(['2020-08-30T05:10:05Zjunk', '2020-08-30T05:10:05x', '2020-08-30T05:10:05.9Z0',
+                    '2020-08-30T01:10:05-04:00x', '2020-08-30T01:10:05-04:', ''],
+                   [np.nan] * 6)
+
+    def test_impossible_dates(self):
+        self.check(['2020-02-30T00:00:00Z', '2021-02-29T00:00:00Z', '1900-02-29T00:00:00Z',
+                    '2020-04-31T00:00:00Z', '2020-13-01T00:00:00Z', '2020-00-10T00:00:00Z'],
+                   [np.nan] * 6)
+
+    def test_leap_days(self):
+        self.check(['2020-02-29T00:00:00Z', '2000-02-29T00:00:00Z', '2020-12-31T00:00:00Z'],
+                   [1582934400.0, 951782400.0, 1609372800.0])
+
+class TrackMetrics(unittest.TestCase):
+
+    def test_speed_from_exact_time_steps(self):
+        # Epoch seconds near 1.6e9 must be subtracted before scaling to hours
+        m = track_metrics([38.9, 38.8, 38.7], [-77.1, -77.0, -76.9], [90, 91, 92], [T0, T0 + 1, T0 + 3])
+        np.testing.assert_array_equal(m['speed'][1:], m['step'][1:] / (np.array([1.0, 2.0]) / 3600))
+
+class LoadTrack(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_csv_round_trip(self):
+        m = track_metrics([38.9, 38.8, 38.7], [-77.1, -77.0, -76.9], [90, 91, 92], [T0, T0 + 1, T0 + 3])
+        write_track(m, self.path)
+        got = load_track(self.path)
+        for name in m.dtype.names:
+            np.testing.assert_allclose(got[name], m[name], rtol=1e-15, err_msg=name)
+
+    def test_old_csv_layout(self):
+        with open(self.path, 'w') as f:
+            f.write('0, 40.0074, -75.2490, 296.9, 0, 0, 0, \n'
+                    '1, 40.0075, -75.2491, 315.5, 4.67, 0.0013, 6.86\n')
+        with self.assertRaisesRegex(ValueError, 'write_csv'):
+            load_track(self.path)
+
+if __name__ == '__main__':
+    unittest.main()
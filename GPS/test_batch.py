@@ -0,0 +1,46 @@
+#!/bin/python
+# Tests for processing directories of GPX tracks with batch
+#
+# Usage: python -m unittest test_batch   (from the GPS directory)
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from batch import process_tracks
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+class ProcessTracks(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.track = os.path.join(self.dir, 'track.gpx')
+        shutil.copy(os.path.join(HERE, 'gpstrack.gpx'), self.track)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, text):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_bad_files_are_errors(self):
+        not_gpx = self.write('notes.gpx', 'lat, lon\n38.9, -77.1\n')
+        empty = self.write('empty.gpx', '')
+        rows, errors = process_tracks([self.track, not_gpx, empty], os.path.join(self.dir, 'out'), workers=1)
+
+        self.assertEqual([row.track for row in rows], ['track'])
+        self.assertGreater(rows[0].points, 0)
+        self.assertEqual(len(errors), 2)
+        for path, error in zip((not_gpx, empty), errors):
+            self.assertIn(path, error)
+            self.assertIn('ValueError', error)
+        with open(os.path.join(self.dir, 'out', 'summary.csv')) as f:
+            self.assertEqual(len(f.readlines()), 2)
+
+if __name__ == '__main__':
+    unittest.main()
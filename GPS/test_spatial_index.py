@@ -0,0 +1,38 @@
+#!/bin/python
+# Tests for the trackpoint index in spatial_index
+#
+# Usage: python -m unittest test_spatial_index   (from the GPS directory)
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from spatial_index import TrackIndex
+
+class SaveLoad(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_any_file_name(self):
+        index = TrackIndex()
+        index.add('a', [38.90, 38.91, np.nan], [-77.10, -77.09, -77.08])
+        index.add('b', [38.95], [-77.05])
+        for name in ('idx.npz', 'idx.bin', 'idx'):
+            path = os.path.join(self.dir, name)
+            index.save(path)
+            self.assertEqual(os.listdir(self.dir), [name])
+            loaded = TrackIndex.load(path)
+            self.assertEqual(loaded.names, index.names)
+            self.assertEqual(loaded.cell, index.cell)
+            np.testing.assert_array_equal(loaded.near(38.9, -77.1, 100), index.near(38.9, -77.1, 100))
+            os.remove(path)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,21 +7,96 @@
 
 # Load the necessary modules
 from math import *
+from collections import namedtuple
 import numpy as np
 
 ## REMOVE THE FOLLOWING LINE ONCE YOU'RE DONE WRITING YOUR ANSWERS!
 # import pr2_key
 
+class Mirror:
+    """Polynomial mirror compiled once from its coefficient list
+
+    m = Mirror(a)
+
+    Input: a = list of coefficients of polynomial mirror
+               (highest degree first)
+
+    The coefficients and the derivative coefficients are stored as float64
+    arrays (m.coef, m.dcoef) and both are evaluated with Horner's scheme,
+    so tracing many rays against the same mirror never rebuilds the
+    derivative. A Mirror can be passed anywhere a coefficient list is
+    accepted (evalpoly, polyder, rayangle, angleBetween, raytrace, ...)."""
+
+    __slots__ = ('coef', 'dcoef', '_c', '_dc', '_deriv')
+
+    def __init__(self, a):
+        coef = np.array(a, dtype=np.float64).ravel()
+        n = len(coef) - 1
+        dcoef = coef[:-1] * np.arange(n, 0, -1) if n > 0 else coef[:0]
+        coef.flags.writeable = False
+        dcoef.flags.writeable = False
+
+        self.coef = coef
+        self.dcoef = dcoef
+        self._c = tuple(coef.tolist())
+        self._dc = tuple(dcoef.tolist())
+        self._deriv = None
+
+    def __call__(self, x):
+        """Evaluate the mirror height at x (scalar or array)"""
+        total = 0.0
+        for c in self._c:
+            total = total * x + c
+        return total
+
+    def slope(self, x):
+        """Evaluate the mirror slope p'(x) at x (scalar or array)"""
+        total = 0.0
+        for c in self._dc:
+            total = total * x + c
+        return total
+
+    @property
+    def derivative(self):
+        """Mirror for p'(x), built on first use and then reused"""
+        if self._deriv is None:
+            self._deriv = Mirror(self.dcoef)
+        return self._deriv
+
+    def __len__(self):
+        return len(self._c)
+
+    def __iter__(self):
+        return iter(self._c)
+
+    def __getitem__(self, i):
+        return self._c[i]
+
+    def __array__(self, dtype=None, copy=None):
+        return np.array(self.coef, dtype=dtype)
+
+    def __repr__(self):
+        return 'Mirror(%r)' % (list(self._c),)
+
+def asmirror(a):
+    """Return a as a Mirror, compiling it only if it isn't one already"""
+    return a if isinstance(a, Mirror) else Mirror(a)
+
 # Problem 2
 
 def evalpoly(a,x):
-    """Evaluate a polynomial at x given a list of coefficients (highest degree first)"""
+    """Evaluate a polynomial at x given a list of coefficients (highest degree first)
+
+    x may be a scalar or a NumPy array, in which case the polynomial is
+    evaluated element-wise. a may also be a Mirror."""
 
-    total, pow = 0, 0
+    if isinstance(a, Mirror):
+        return a(x)
 
-    for i in reversed(a):
-        total += (x ** pow) * i
-        pow += 1
+    total = 0
+
+    for i in a:
+        total = total * x + i
 
     return total
 
@@ -29,7 +104,18 @@ def evalpoly(a,x):
 
 
 def polyder(a):
-    """Compute the derivative of a polynomial, represented as a list of coefficients (highest degree first)"""
+    """Compute the derivative of a polynomial, represented as a list of coefficients (highest degree first)
+
+    If a is a NumPy array the derivative is returned as a new array (the
+    input is left untouched); stacked coefficient rows are differentiated
+    row by row. If a is a Mirror its cached derivative Mirror is returned."""
+    if isinstance(a, Mirror):
+        return a.derivative
+
+    if isinstance(a, np.ndarray):
+        n = a.shape[-1] - 1
+        return a[..., :-1] * np.arange(n, 0, -1)
+
     total = 1
     poly = a[:-1]
     n = len(poly) - 1
@@ -48,45 +134,385 @@ def rayangle(x_,y_,a,x):
 
     Input: x_,y_ = location of source or camera
         a     = list of coefficients of polynomial mirror
-                (highest degree first)
+                (highest degree first), or a Mirror
         x     = location along the mirror (in x-axis) to
                 compute angle
-    Output: angle = angle of incidence/reflection (in radians)"""
+    Output: angle = angle of incidence/reflection (in radians)
+
+    x_, y_ and x may be NumPy arrays; they are broadcast against each other
+    and the angle is computed element-wise."""
 
-    x1, y1 = x, evalpoly(a, x)
+    m = asmirror(a)
 
-    normal = atan2(1, -evalpoly(polyder(a), x))
+    x1, y1 = x, m(x)
 
-    theta1 = atan2(y1 - y_, x1 - x_)
+    if isinstance(x, float) and isinstance(x_, float) and isinstance(y_, float):
+        # Scalar fast path (raytrace): math is far cheaper than ufuncs here
+        normal = atan2(1, -m.slope(x))
+        theta1 = atan2(y1 - y_, x1 - x_)
 
-    if abs(normal - theta1) <= pi:
-        return abs(normal - theta1)
-    else:
-        return abs((2 * pi + theta1) - normal)
+        if abs(normal - theta1) <= pi:
+            return abs(normal - theta1)
+        else:
+            return abs((2 * pi + theta1) - normal)
+
+    normal = np.arctan2(1, -m.slope(x))
+
+    theta1 = np.arctan2(y1 - y_, x1 - x_)
+
+    angle = np.abs(normal - theta1)
+    return np.where(angle <= pi, angle, np.abs((2 * pi + theta1) - normal))[()]
 
 #    return pr2_key.rayangle(x_,y_,a,x)
 
+def drayangle(x_,y_,a,x):
+    """Derivative of rayangle with respect to the mirror location x
+    dangle=drayangle(x_,y_,a,x)
+
+    Input: same as rayangle
+    Output: dangle = d(angle)/dx (in radians per unit x), element-wise"""
+
+    m = asmirror(a)
+    x, x_, y_ = (np.asarray(v, dtype=float) for v in (x, x_, y_))
+
+    y1, s = m(x), m.slope(x)
+    u, v = x - x_, y1 - y_
+
+    normal = np.arctan2(1, -s)
+    theta1 = np.arctan2(v, u)
+
+    # d(normal)/dx = p''/(1 + p'^2),  d(theta1)/dx = (u p' - v)/(u^2 + v^2)
+    dnormal = m.derivative.slope(x) / (1 + s * s)
+    dtheta1 = (u * s - v) / (u * u + v * v)
+
+    angle = normal - theta1
+    return np.where(np.abs(angle) <= pi,
+                    np.sign(angle) * (dnormal - dtheta1),
+                    np.sign(2 * pi + theta1 - normal) * (dtheta1 - dnormal))[()]
+
 # Problem 4
 
 def angleBetween(xs,ys,xc,yc,a,x):
     # Optional helper function. You are not required to use this.
+    a = asmirror(a)
 
     theta_source = rayangle(xs, ys, a, x)
     theta_camera = rayangle(xc, yc, a, x)
 
     return theta_source - theta_camera
 
+def dangleBetween(xs,ys,xc,yc,a,x):
+    """Derivative of angleBetween with respect to the mirror location x"""
+    a = asmirror(a)
+
+    return drayangle(xs, ys, a, x) - drayangle(xc, yc, a, x)
+
 def findRoot(x0,y0,x1,y1):
     # Optional helper function. You are not required to use this.
-    if x1 == x0:
-        return NaN
+    # Works element-wise on arrays; lanes with x1 == x0 come back as NaN.
+    if all(isinstance(v, float) for v in (x0, y0, x1, y1)):
+        if x1 == x0:
+            return nan
+        m = (y0 - y1) / (x0 - x1)
+        if m != 0:
+            return (-y1 / m) + x1
 
-    m = (y0 - y1) / (x0 - x1)
-    x = (-y1 / m) + x1
+    x0, y0, x1, y1 = (np.asarray(v, dtype=float) for v in (x0, y0, x1, y1))
 
-    return x
+    with np.errstate(divide='ignore', invalid='ignore'):
+        m = (y0 - y1) / (x0 - x1)
+        x = (-y1 / m) + x1
 
-def raytrace(x_s,y_s,x_c,y_c,a,x_guess):
+    return np.where(x1 == x0, nan, x)[()]
+
+def raytrace_batch(x_s,y_s,x_c,y_c,a,x_guess,method='secant',**options):
+    """Compute reflection locations for many source/camera pairs at once
+
+    x,y = raytrace_batch(x_s,y_s,x_c,y_c,a,x_guess)
+
+    Input:
+       x_s,y_s = arrays of source locations
+       x_c,y_c = arrays of camera locations
+       a       = is a vector of length N (1xN matrix),
+                 listing the an N-1 degree polynomial mirror
+                 (shared by every ray), or a Mirror
+       x_guess = array of initial guesses for the reflection points
+       method  = 'secant' (default) or 'safe' to use raytrace_safe, in
+                 which case options (xtol, rtol, maxiter, ...) are passed on
+    Output:
+       x,y = arrays of the locations where angle of incidence == reflection
+
+    All inputs are broadcast against each other, so scalars may be mixed
+    with arrays (e.g. one camera, many sources). Each lane runs the same
+    two seed evaluations and up to five secant steps as raytrace. A lane
+    is held where it is once it lands exactly on its root, or once a
+    secant step can't be taken (the last two angles are equal, or the
+    step comes out infinite or NaN), rather than being turned into NaN."""
+
+    if method == 'safe':
+        return raytrace_safe(x_s, y_s, x_c, y_c, a, x_guess, **options)[:2]
+    if method != 'secant':
+        raise ValueError("unknown raytrace method %r" % (method,))
+    if options:
+        raise TypeError("the secant method takes no options, got %s" % ', '.join(sorted(options)))
+
+    a = asmirror(a)
+
+    x_s, y_s, x_c, y_c, x_guess = np.broadcast_arrays(
+        *(np.asarray(v, dtype=float) for v in (x_s, y_s, x_c, y_c, x_guess)))
+    if x_guess.ndim == 0:
+        # Plain floats keep the single-ray case on the scalar fast paths
+        x_s, y_s, x_c, y_c, x_guess = (float(v) for v in (x_s, y_s, x_c, y_c, x_guess))
+
+    def F(x):
+        return angleBetween(x_s, y_s, x_c, y_c, a, x)
+
+    f0 = F(x_guess)
+    x1 = x_guess + 0.1
+    f1 = F(x1)
+
+    x = findRoot(x_guess, f0, x1, f1)
+    x_prev, f_prev = x1, f1
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for i in range(5):
+            f = F(x)
+            done = (x == x_prev) | (f == 0) | (f == f_prev)
+            if np.all(done):
+                break
+            x_new = findRoot(x_prev, f_prev, x, f)
+            done = done | ~np.isfinite(x_new)
+            x_prev, f_prev, x = x, f, np.where(done, x, x_new)[()]
+
+    return (x, evalpoly(a, x))
+
+TraceStats = namedtuple('TraceStats', ['iterations', 'converged'])
+
+def raytrace_safe(x_s,y_s,x_c,y_c,a,x_guess,xtol=1e-12,rtol=1e-12,ftol=1e-9,maxiter=50,window=1e3):
+    """Compute reflection locations with a tolerance-driven, safeguarded solver
+
+    x,y,stats = raytrace_safe(x_s,y_s,x_c,y_c,a,x_guess)
+
+    Input:
+       x_s,y_s,x_c,y_c,a,x_guess = as for raytrace_batch (scalars or arrays)
+       xtol,rtol = a lane stops once its step is <= xtol + rtol*|x|
+       ftol      = largest |angleBetween| accepted as a reflection
+       maxiter   = budget of solver steps per lane; no lane takes more
+       window    = only look for a reflection within x_guess +/- window
+    Output:
+       x,y   = locations where angle of incidence == reflection
+       stats = TraceStats(iterations, converged); iterations counts the
+               solver steps (seeds, bracket growth, Newton/bisection)
+               spent on each lane
+
+    Each lane first takes Newton steps from x_guess using the analytic
+    derivative (dangleBetween); most lanes converge here in a handful of
+    steps and exit. Lanes that don't converge within a few steps restart
+    from the seeds raytrace uses (x_guess and x_guess + 0.1), widen them
+    until angleBetween changes sign, and then take Newton steps that fall
+    back to bisection whenever a step would leave the bracket. converged
+    is only set when |angleBetween| <= ftol as well, so a sign change
+    across an angle wrap-around (or the angles merging far out along the
+    mirror) is not reported as a reflection."""
+
+    x_s, y_s, x_c, y_c, x_guess = np.broadcast_arrays(
+        *(np.asarray(v, dtype=float) for v in (x_s, y_s, x_c, y_c, x_guess)))
+    shape = x_guess.shape
+    x_s, y_s, x_c, y_c, x_guess = (v.ravel() for v in (x_s, y_s, x_c, y_c, x_guess))
+    a = asmirror(a)
+
+    # Only the lanes still being worked on (index array i) are evaluated
+    def f(x, i):
+        return angleBetween(x_s[i], y_s[i], x_c[i], y_c[i], a, x)
+
+    def df(x, i):
+        return dangleBetween(x_s[i], y_s[i], x_c[i], y_c[i], a, x)
+
+    lanes = np.arange(x_guess.size)
+    x_min, x_max = x_guess - window, x_guess + 0.1 + window
+
+    x = x_guess.copy()
+    fx = f(x, lanes)
+    iterations = np.ones(x.size, dtype=int)
+    stopped = fx == 0
+    bracketed = np.zeros(x.size, dtype=bool)
+    lo, hi, flo = x.copy(), x.copy(), fx.copy()
+
+    def newton(i, budget):
+        # Newton steps on lanes i, bisecting bracketed lanes whenever a step
+        # leaves [lo, hi]; marks lanes stopped once they meet the tolerance
+        while True:
+            i = i[iterations[i] < budget]
+            if not i.size:
+                return
+
+            xi, b = x[i], bracketed[i]
+            x_new = xi - fx[i] / df(xi, i)
+            bisect = b & ~((x_new > lo[i]) & (x_new < hi[i]))
+            x_new = np.where(bisect, 0.5 * (lo[i] + hi[i]), x_new)
+            f_new = f(x_new, i)
+            iterations[i] += 1
+
+            same = b & (np.sign(f_new) == np.sign(flo[i]))
+            other = b & ~same
+            lo[i[same]], flo[i[same]] = x_new[same], f_new[same]
+            hi[i[other]] = x_new[other]
+            x[i], fx[i] = x_new, f_new
+
+            tol = xtol + rtol * np.abs(x_new)
+            stop = ((np.abs(x_new - xi) <= tol) | (f_new == 0) | ~np.isfinite(x_new)
+                    | (b & (hi[i] - lo[i] <= tol)) | (x_new < x_min[i]) | (x_new > x_max[i]))
+            stopped[i[stop]] = True
+            i = i[~stop]
+
+    def accepted():
+        return stopped & (x >= x_min) & (x <= x_max) & (np.abs(fx) <= ftol)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Plain Newton from the guess
+        newton(lanes[~stopped], min(maxiter, 8))
+
+        # Fallback: bracket from the seeds, growing both ends until
+        # angleBetween changes sign or the window is exhausted. The two
+        # seeds count against the budget, so lanes without room for them
+        # keep what Newton found
+        i = lanes[~accepted() & (iterations + 2 <= maxiter)]
+        lo[i], hi[i] = x_guess[i], x_guess[i] + 0.1
+        flo[i], fhi = f(lo[i], i), f(hi[i], i)
+        iterations[i] += 2
+        stopped[i] = False
+
+        j = np.arange(i.size)
+        while True:
+            j = j[(np.sign(flo[i[j]]) == np.sign(fhi[j]))
+                  & ((lo[i[j]] > x_min[i[j]]) | (hi[i[j]] < x_max[i[j]]))
+                  & (iterations[i[j]] < maxiter)]
+            if not j.size:
+                break
+            k = i[j]
+            grow = 0.8 * (hi[k] - lo[k])
+            lo[k] = np.maximum(lo[k] - grow, x_min[k])
+            hi[k] = np.minimum(hi[k] + grow, x_max[k])
+            flo[k], fhi[j] = f(lo[k], k), f(hi[k], k)
+            iterations[k] += 1
+        bracketed[i] = np.sign(flo[i]) != np.sign(fhi)
+
+        # Start from the end of the bracket with smaller |f|
+        start_lo = np.abs(flo[i]) <= np.abs(fhi)
+        x[i] = np.where(start_lo, lo[i], hi[i])
+        fx[i] = np.where(start_lo, flo[i], fhi)
+        stopped[i] = fx[i] == 0
+
+        newton(i[~stopped[i]], maxiter)
+
+    stats = TraceStats(iterations.reshape(shape)[()], accepted().reshape(shape)[()])
+    x = x.reshape(shape)
+
+    return (x[()], evalpoly(a, x)[()], stats)
+
+def raytrace_all(x_s,y_s,x_c,y_c,a,x_min,x_max,samples=1024,xtol=1e-12,rtol=1e-12,ftol=1e-9,maxiter=60):
+    """Compute every reflection location on a stretch of the mirror
+
+    x,y = raytrace_all(x_s,y_s,x_c,y_c,a,x_min,x_max)
+
+    Input:
+       x_s,y_s = is the location of the source
+       x_c,y_c = is the location of the camera
+       a       = list of mirror coefficients (highest degree first), or a Mirror
+       x_min,x_max = the interval of the mirror to search
+       samples = number of grid points used to look for sign changes
+       xtol,rtol,ftol,maxiter = as for raytrace_safe
+    Output:
+       x,y = arrays (sorted by x) of every location where angle of
+             incidence == reflection
+
+    angleBetween is sampled on a grid over [x_min, x_max] in one vectorized
+    call, every sign change between neighbouring samples becomes a
+    bracket, and all brackets are refined together (Newton steps with
+    bisection fallback) as one batch. Sign changes that turn out to be
+    angle wrap-arounds rather than reflections (|angleBetween| > ftol at
+    the end) are dropped. Reflections closer together than the grid
+    spacing, or where angleBetween only touches zero, can be missed;
+    raise samples if that matters."""
+
+    a = asmirror(a)
+
+    grid = np.linspace(x_min, x_max, samples)
+    f_grid = angleBetween(x_s, y_s, x_c, y_c, a, grid)
+
+    exact = grid[f_grid == 0]
+    k = np.flatnonzero(np.sign(f_grid[:-1]) * np.sign(f_grid[1:]) < 0)
+    lo, hi, flo = grid[k], grid[k + 1], f_grid[k]
+
+    x = 0.5 * (lo + hi)
+    fx = angleBetween(x_s, y_s, x_c, y_c, a, x)
+
+    i = np.flatnonzero(fx != 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for it in range(maxiter):
+            if not i.size:
+                break
+
+            same = np.sign(fx[i]) == np.sign(flo[i])
+            lo[i[same]], flo[i[same]] = x[i[same]], fx[i[same]]
+            hi[i[~same]] = x[i[~same]]
+
+            xi = x[i]
+            x_new = xi - fx[i] / dangleBetween(x_s, y_s, x_c, y_c, a, xi)
+            inside = (x_new > lo[i]) & (x_new < hi[i])
+            x_new = np.where(inside, x_new, 0.5 * (lo[i] + hi[i]))
+            x[i] = x_new
+            fx[i] = angleBetween(x_s, y_s, x_c, y_c, a, x_new)
+
+            tol = xtol + rtol * np.abs(x_new)
+            stop = (np.abs(x_new - xi) <= tol) | (fx[i] == 0) | (hi[i] - lo[i] <= tol)
+            i = i[~stop]
+
+    x = np.sort(np.concatenate((exact, x[np.abs(fx) <= ftol])))
+
+    return (x, evalpoly(a, x))
+
+def _raytrace_scalar(x_s,y_s,x_c,y_c,a,x_guess):
+    """raytrace_batch's secant iteration for one ray, on plain floats
+
+    Horner's scheme and the angles are written out with math, so a single
+    ray pays no array overhead; the steps and the lanes' hold rules are
+    the same, so the result matches raytrace_batch exactly."""
+
+    m = asmirror(a)
+    c, dc = m._c, m._dc
+
+    def F(x):
+        y = s = 0.0
+        for k in c:
+            y = y * x + k
+        for k in dc:
+            s = s * x + k
+        normal = atan2(1, -s)
+        angle = 0.0
+        for x_, y_, sign in ((x_s, y_s, 1), (x_c, y_c, -1)):
+            theta1 = atan2(y - y_, x - x_)
+            if abs(normal - theta1) <= pi:
+                angle += sign * abs(normal - theta1)
+            else:
+                angle += sign * abs((2 * pi + theta1) - normal)
+        return angle
+
+    x_prev, f_prev = x_guess + 0.1, F(x_guess + 0.1)
+    x = findRoot(x_guess, F(x_guess), x_prev, f_prev)
+
+    for i in range(5):
+        f = F(x)
+        if x == x_prev or f == 0 or f == f_prev:
+            break
+        x_new = findRoot(x_prev, f_prev, x, f)
+        if not isfinite(x_new):
+            break
+        x_prev, f_prev, x = x, f, x_new
+
+    return (x, m(x))
+
+def raytrace(x_s,y_s,x_c,y_c,a,x_guess,method='secant',**options):
     """Compute reflection location on polynomially-curved mirror
 
     x,y = raytrace(x_s,y_s,x_c,y_c,a,x_guess)
@@ -95,22 +521,21 @@ def raytrace(x_s,y_s,x_c,y_c,a,x_guess):
        x_s,y_s = is the location of the source
        x_c,y_c = is the location of the camera
        a       = is a vector of length N (1xN matrix),
-                 listing the an N-1 degree polynomial mirror
+                 listing the an N-1 degree polynomial mirror,
+                 or a Mirror
        x_guess = is the initial guess for a reflection point
+       method  = 'secant' (default) or 'safe' (see raytrace_safe)
     Output:
-       x,y = a tuple specifying the location where angle of incidence == reflection"""
+       x,y = a tuple specifying the location where angle of incidence == reflection
 
-    f0 = angleBetween(x_s, y_s, x_c, y_c, a, x_guess)
-    f1 = angleBetween(x_s, y_s, x_c, y_c, a, x_guess + 0.1)
+    A single ray given as plain numbers is traced on floats; arrays and
+    the safe method go through raytrace_batch."""
 
-    x = findRoot(x_guess, f0, x_guess + 0.1, f1)
-    f = [f0, f1]
-    x = [x_guess, x_guess + 0.1, x]
+    args = (x_s, y_s, x_c, y_c, x_guess)
+    if method == 'secant' and not options and all(isinstance(v, (int, float)) for v in args):
+        return _raytrace_scalar(*(float(v) for v in args[:4]), a, float(x_guess))
 
-    for i in range(5):
-#        print(x, f)
-        f.append(angleBetween(x_s, y_s, x_c, y_c, a, x[-1]))
-        x.append(findRoot(x[-2], f[-2], x[-1], f[-1]))
+    x, y = raytrace_batch(x_s, y_s, x_c, y_c, a, x_guess, method, **options)
 
-    return (x[-1], evalpoly(a, x[-1]))
+    return (x, y)
 #    return pr2_key.raytrace(x_s,y_s,x_c,y_c,a,x_guess)
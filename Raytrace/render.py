@@ -0,0 +1,150 @@
+#!/bin/python
+# Render reflection maps for a polynomial mirror using pr2.raytrace_batch
+#
+# For a fixed camera, every pixel of the image is a source position on a
+# regular 2-D grid, and its value is where (or at what angle) the ray from
+# that source reflects off the mirror into the camera.
+#
+# Usage: python render.py --mirror 0.1 0 -1 --camera -1.5 2 \
+#            --xs -3 3 --ys 1 5 --size 512 512 -o reflections.npy
+
+import argparse
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from pr2 import Mirror, rayangle, raytrace_batch
+
+RenderSpec = namedtuple('RenderSpec', ['coef', 'x_c', 'y_c', 'xs', 'ys', 'x_guess', 'output', 'method'])
+
+OUTPUTS = ('x', 'y', 'angle')
+
+def tiles(shape, tile):
+    """List the (r0, r1, c0, c1) tiles covering an image, in row-major order
+
+    The tiling only depends on the image shape and tile size, so the serial
+    and parallel renderers evaluate exactly the same blocks of pixels."""
+    rows, cols = shape
+    th, tw = tile
+    return [(r, min(r + th, rows), c, min(c + tw, cols))
+            for r in range(0, rows, th)
+            for c in range(0, cols, tw)]
+
+def render_tile(spec, r0, r1, c0, c1):
+    """Trace one tile of the image and return its pixel values"""
+    a = Mirror(spec.coef)
+    x_s, y_s = np.meshgrid(spec.xs[c0:c1], spec.ys[r0:r1])
+    x_guess = spec.x_guess[r0:r1, c0:c1]
+
+    # Rays that miss the mirror come back as NaN; don't warn per pixel
+    with np.errstate(all='ignore'):
+        x, y = raytrace_batch(x_s, y_s, spec.x_c, spec.y_c, a, x_guess, spec.method)
+
+        if spec.output == 'x':
+            return x
+        if spec.output == 'y':
+            return y
+        return rayangle(spec.x_c, spec.y_c, a, x)
+
+# Per-process state for pool workers, set once by _init_worker
+_worker = {}
+
+def _init_worker(shm_name, shape, spec):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker['shm'] = shm
+    _worker['image'] = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    _worker['spec'] = spec
+
+def _render_shared(bounds):
+    r0, r1, c0, c1 = bounds
+    _worker['image'][r0:r1, c0:c1] = render_tile(_worker['spec'], r0, r1, c0, c1)
+
+def render(a, x_c, y_c, xs, ys, x_guess=0.0, output='x', tile=(128, 128), workers=None, method='secant'):
+    """Render a reflection map for a grid of source positions
+
+    image = render(a, x_c, y_c, xs, ys)
+
+    Input:
+       a       = list of coefficients of polynomial mirror
+                 (highest degree first), or a Mirror
+       x_c,y_c = location of the camera
+       xs,ys   = source positions along each axis; pixel (i, j) is the
+                 source at (xs[j], ys[i])
+       x_guess = initial guess for the reflection points, a scalar or an
+                 array broadcastable to (len(ys), len(xs))
+       output  = 'x' or 'y' for the reflection location, or 'angle' for
+                 the angle of reflection (radians)
+       tile    = (rows, cols) of each block of pixels handed to a worker
+       workers = size of the process pool; None uses every core and 1
+                 renders serially in this process
+       method  = raytrace method, 'secant' or 'safe'
+    Output:
+       image = float64 array of shape (len(ys), len(xs))
+
+    Tiles are fanned out over a process pool and each worker writes its
+    pixels straight into a shared-memory image, so no results are
+    pickled back. The serial path traces the same tiles, which keeps the
+    two bit-for-bit identical."""
+
+    if output not in OUTPUTS:
+        raise ValueError("output must be one of %s, not %r" % (', '.join(OUTPUTS), output))
+
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    shape = (len(ys), len(xs))
+    x_guess = np.broadcast_to(np.asarray(x_guess, dtype=np.float64), shape)
+    spec = RenderSpec(tuple(np.asarray(a, dtype=np.float64).tolist()), float(x_c), float(y_c),
+                      xs, ys, x_guess, output, method)
+    blocks = tiles(shape, tile)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(blocks))
+
+    if workers <= 1:
+        image = np.empty(shape)
+        for r0, r1, c0, c1 in blocks:
+            image[r0:r1, c0:c1] = render_tile(spec, r0, r1, c0, c1)
+        return image
+
+    shm = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * 8))
+    try:
+        with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                 initargs=(shm.name, shape, spec)) as pool:
+            list(pool.map(_render_shared, blocks))
+        image = np.ndarray(shape, dtype=np.float64, buffer=shm.buf).copy()
+    finally:
+        shm.close()
+        shm.unlink()
+
+    return image
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render a reflection map for a polynomial mirror.')
+    parser.add_argument('--mirror', type=float, nargs='+', required=True,
+                        help='mirror coefficients, highest degree first')
+    parser.add_argument('--camera', type=float, nargs=2, required=True, metavar=('X', 'Y'))
+    parser.add_argument('--xs', type=float, nargs=2, required=True, metavar=('MIN', 'MAX'),
+                        help='range of source x positions')
+    parser.add_argument('--ys', type=float, nargs=2, required=True, metavar=('MIN', 'MAX'),
+                        help='range of source y positions')
+    parser.add_argument('--size', type=int, nargs=2, default=(512, 512), metavar=('W', 'H'))
+    parser.add_argument('--guess', type=float, default=0.0, help='initial guess for every ray')
+    parser.add_argument('--output', choices=OUTPUTS, default='x')
+    parser.add_argument('--method', choices=('secant', 'safe'), default='secant')
+    parser.add_argument('--tile', type=int, nargs=2, default=(128, 128), metavar=('ROWS', 'COLS'))
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('-o', '--out', default='reflections.npy', help='where to save the image (.npy)')
+    args = parser.parse_args(argv)
+
+    xs = np.linspace(args.xs[0], args.xs[1], args.size[0])
+    ys = np.linspace(args.ys[0], args.ys[1], args.size[1])
+    image = render(args.mirror, args.camera[0], args.camera[1], xs, ys, args.guess,
+                   args.output, tuple(args.tile), args.workers, args.method)
+    np.save(args.out, image)
+
+if __name__ == '__main__':
+    main()
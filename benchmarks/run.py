@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+# Benchmarks for the numerical kernels in Raytrace/pr2.py and GPS/Project1_GPS.py
+#
+# Everything runs offline on synthetic inputs generated from fixed seeds.
+#
+# Usage:
+#   python benchmarks/run.py                      # quick suite, saves JSON
+#   python benchmarks/run.py --full               # adds 10^6 rays, 10^6-10^7 point tracks
+#   python benchmarks/run.py -k raytrace          # only cases whose name contains "raytrace"
+#   python benchmarks/run.py --compare base.json new.json --threshold 0.10
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'Raytrace'))
+sys.path.insert(0, os.path.join(ROOT, 'GPS'))
+
+import pr2
+import Project1_GPS as gps
+import simplify
+
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+DEGREES = (2, 5, 10, 20)
+BATCH_SIZES = (1, 100, 10 ** 4, 10 ** 5)
+BATCH_SIZES_FULL = BATCH_SIZES + (10 ** 6,)
+SCALAR_RAYS = (1, 100, 1000)
+TRACK_POINTS = (10 ** 3, 10 ** 4, 10 ** 5)
+TRACK_POINTS_FULL = TRACK_POINTS + (10 ** 6, 10 ** 7)
+
+# Synthetic inputs
+
+def mirror(deg, seed=0):
+    """Random mirror of the given degree, scaled so it stays O(1) on [-3, 3]"""
+    rng = np.random.default_rng(seed)
+    coef = rng.normal(size=deg + 1) / 3.0 ** np.arange(deg, -1, -1)
+    coef[-1] -= 1
+    return coef.tolist()
+
+def rays(n, seed=0):
+    """Sources, cameras and guesses for n rays above the mirror"""
+    rng = np.random.default_rng(seed)
+    return (rng.uniform(-3, 3, n), rng.uniform(2, 5, n),
+            rng.uniform(-3, 3, n), rng.uniform(2, 5, n), rng.uniform(-1, 1, n))
+
+def track(n, seed=0):
+    """A random walk of n trackpoints, one second apart"""
+    rng = np.random.default_rng(seed)
+    lats = 40.0 + np.cumsum(rng.normal(0, 2e-5, n))
+    lons = -75.2 + np.cumsum(rng.normal(0, 2e-5, n))
+    els = 90 + np.cumsum(rng.normal(0, 0.2, n))
+    ts = 5 * 3600 + np.arange(n, dtype=float)
+    return lats, lons, els, ts
+
+def write_gpx(path, n, seed=0):
+    """Write a synthetic track in the same layout as GPS/gpstrack.gpx"""
+    lats, lons, els, ts = track(n, seed)
+    start = np.datetime64('2020-08-30T00:00:00')
+    with open(path, 'w') as f:
+        f.write('<?xml version="1.0" encoding="utf-8"?>\n'
+                '<gpx xmlns="http://www.topografix.com/GPX/1/1"'
+                ' xmlns:mytracks="http://mytracks.stichling.info/myTracksGPX/1/0"'
+                ' creator="benchmarks" version="1.1">'
+                '<trk><name>synthetic</name><trkseg>')
+        chunk = 10 ** 5
+        for i in range(0, n, chunk):
+            stamps = np.datetime_as_string(start + (ts[i:i + chunk] * 1000).astype('timedelta64[ms]'))
+            f.write(''.join(
+                '<trkpt lat="%r" lon="%r"><ele>%r</ele><time>%sZ</time>'
+                '<extensions><mytracks:speed>0</mytracks:speed></extensions></trkpt>' % row
+                for row in zip(lats[i:i + chunk].tolist(), lons[i:i + chunk].tolist(),
+                               els[i:i + chunk].tolist(), stamps)))
+        f.write('</trkseg></trk></gpx>\n')
+
+# Benchmark cases: each yields (name, params, items, fn) where fn() runs the
+# kernel once over `items` inputs
+
+def raytrace_cases(full):
+    for deg in DEGREES:
+        a = mirror(deg)
+        yield 'raytrace.polyder', {'degree': deg}, 1, lambda a=a: pr2.polyder(list(a))
+        for n in BATCH_SIZES_FULL if full else BATCH_SIZES:
+            x_s, y_s, x_c, y_c, g = rays(n)
+            yield ('raytrace.evalpoly', {'degree': deg, 'rays': n}, n,
+                   lambda a=a, g=g: pr2.evalpoly(a, g))
+            yield ('raytrace.rayangle', {'degree': deg, 'rays': n}, n,
+                   lambda a=a, x_s=x_s, y_s=y_s, g=g: pr2.rayangle(x_s, y_s, a, g))
+            yield ('raytrace.raytrace_batch', {'degree': deg, 'rays': n}, n,
+                   lambda a=a, r=(x_s, y_s, x_c, y_c, g): pr2.raytrace_batch(*r[:4], a, r[4]))
+        for n in SCALAR_RAYS:
+            r = [v.tolist() for v in rays(n)]
+            yield ('raytrace.raytrace', {'degree': deg, 'rays': n}, n,
+                   lambda a=a, r=r: [pr2.raytrace(xs, ys, xc, yc, a, g) for xs, ys, xc, yc, g in zip(*r)])
+
+class ChildImport:
+    """Import a module in a fresh interpreter; the child reports its own
+    peak resident memory, kept in peak_bytes, since tracemalloc in this
+    process would only see the cost of subprocess.run"""
+
+    def __init__(self, module, env):
+        self.module, self.env, self.peak_bytes = module, env, None
+
+    def __call__(self):
+        code = ('import resource, sys\nimport %s\n'
+                'sys.stdout.write(str(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))' % self.module)
+        done = subprocess.run([sys.executable, '-c', code], env=self.env, check=True,
+                              stdout=subprocess.PIPE, text=True)
+        # ru_maxrss is in kilobytes on Linux, bytes on macOS
+        self.peak_bytes = int(done.stdout) * (1 if sys.platform == 'darwin' else 1024)
+
+def import_cases():
+    # Cold import of the GPS module in a fresh interpreter, next to a bare
+    # numpy import so the module's own share is visible
+    env = dict(os.environ, PYTHONPATH=os.path.join(ROOT, 'GPS'),
+               PYTHONDONTWRITEBYTECODE='1')
+    for name, module in (('gps.import', 'Project1_GPS'), ('gps.import.numpy_only', 'numpy')):
+        yield name, {}, 1, ChildImport(module, env)
+
+def gps_cases(full, workdir, wanted=lambda name: True):
+    # Inputs are only built for the cases wanted (run's -k filter), since
+    # the larger tracks take a while to generate and write out
+    for n in TRACK_POINTS_FULL if full else TRACK_POINTS:
+        if wanted('gps.readGPX'):
+            path = os.path.join(workdir, 'track_%d.gpx' % n)
+            write_gpx(path, n)
+            yield 'gps.readGPX', {'points': n}, n, lambda path=path: gps.readGPX(path)
+
+        if wanted('gps.parse_iso8601'):
+            start = np.datetime64('2020-08-30T05:00:00')
+            stamps = np.char.add(np.datetime_as_string(start + np.arange(n) * np.timedelta64(937, 'ms')), 'Z')
+            stamps = stamps.astype('S')
+            yield 'gps.parse_iso8601', {'stamps': n}, n, lambda stamps=stamps: gps.parse_iso8601(stamps)
+
+        if wanted('gps.track_metrics'):
+            yield ('gps.track_metrics', {'points': n}, n,
+                   lambda p=track(n): gps.track_metrics(*p))
+
+        if wanted('gps.douglas_peucker'):
+            yield ('gps.douglas_peucker', {'points': n, 'tolerance_ft': 16}, n,
+                   lambda p=track(n): simplify.douglas_peucker(p[0], p[1], 16.0))
+
+        if n > 10 ** 6 or not (wanted('gps.stepsize') or wanted('gps.speedoverstep')):
+            continue  # the scalar helpers are timed per point; 10^6 is plenty
+        lats, lons, els, ts = (v.tolist() for v in track(n))
+        yield ('gps.stepsize', {'points': n}, n - 1,
+               lambda p=(lats, lons): [gps.stepsize(p[0][i - 1], p[1][i - 1], p[0][i], p[1][i])
+                                       for i in range(1, len(p[0]))])
+        yield ('gps.speedoverstep', {'points': n}, n - 1,
+               lambda p=(lats, lons, ts): [gps.speedoverstep(p[0][i - 1], p[1][i - 1], p[0][i], p[1][i],
+                                                             p[2][i - 1], p[2][i])
+                                           for i in range(1, len(p[0]))])
+
+# Measurement
+
+def measure(fn, min_time=0.2, repeat=5):
+    """Best wall time of fn() in seconds, and peak traced memory in bytes
+    (or fn.peak_bytes, for work done in another process)"""
+    start = time.perf_counter()
+    fn()
+    once = time.perf_counter() - start
+
+    if once >= 1.0:
+        best = once
+    else:
+        timer = timeit.Timer(fn)
+        number = max(1, int(min_time / max(once, 1e-9)))
+        best = min(timer.repeat(repeat=repeat, number=number)) / number
+
+    if hasattr(fn, 'peak_bytes'):
+        return best, fn.peak_bytes
+
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return best, peak
+
+def key(result):
+    return result['name'] + ' ' + json.dumps(result['params'], sort_keys=True)
+
+def run(args):
+    results = []
+    def wanted(name):
+        return not args.k or args.k in name
+
+    with tempfile.TemporaryDirectory() as workdir, np.errstate(all='ignore'):
+        cases = [raytrace_cases(args.full), import_cases(), gps_cases(args.full, workdir, wanted)]
+        for group in cases:
+            for name, params, items, fn in group:
+                if not wanted(name):
+                    continue
+                seconds, peak = measure(fn, repeat=args.repeat)
+                result = {'name': name, 'params': params, 'items': items, 'seconds': seconds,
+                          'throughput': items / seconds, 'peak_bytes': peak}
+                results.append(result)
+                print('%-48s %12.4g s %14.4g items/s %10.1f MiB'
+                      % (key(result), seconds, result['throughput'], peak / 2 ** 20))
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'full': args.full,
+        },
+        'results': results,
+    }
+
+    out = args.output
+    if out is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        out = os.path.join(RESULTS_DIR, datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=1)
+    print('saved', out)
+
+def compare(base_path, new_path, threshold):
+    """Print per-case ratios; return the number of regressions beyond threshold"""
+    with open(base_path) as f:
+        base = {key(r): r for r in json.load(f)['results']}
+    with open(new_path) as f:
+        new = {key(r): r for r in json.load(f)['results']}
+
+    regressions = 0
+    for k in sorted(set(base) & set(new)):
+        time_ratio = new[k]['seconds'] / base[k]['seconds']
+        mem_ratio = (new[k]['peak_bytes'] + 1) / (base[k]['peak_bytes'] + 1)
+        flags = []
+        if time_ratio > 1 + threshold:
+            flags.append('SLOWER')
+        if mem_ratio > 1 + threshold:
+            flags.append('MORE MEMORY')
+        regressions += bool(flags)
+        print('%-48s time x%6.3f  memory x%6.3f  %s' % (k, time_ratio, mem_ratio, ' '.join(flags)))
+
+    for k in sorted(set(base) ^ set(new)):
+        print('%-48s only in %s' % (k, 'base' if k in base else 'new'))
+
+    print('%d regression(s) beyond %.0f%%' % (regressions, 100 * threshold))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Raytrace and GPS kernels.')
+    parser.add_argument('--full', action='store_true',
+                        help='include 10^6-ray batches and 10^6-10^7 point tracks')
+    parser.add_argument('-k', metavar='SUBSTRING', help='only run cases whose name contains this')
+    parser.add_argument('--repeat', type=int, default=5, help='timing repeats (best is kept)')
+    parser.add_argument('-o', '--output', help='JSON file to write (default benchmarks/results/<time>.json)')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'),
+                        help='compare two saved runs instead of running')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='relative slowdown/memory growth counted as a regression')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return 1 if compare(args.compare[0], args.compare[1], args.threshold) else 0
+    run(args)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+#!/bin/python
+# Great-circle distances, shared by the GPS and Capstone_Weather projects
+#
+# One haversine for every use: point-to-point with NumPy broadcasting,
+# the steps along a track, and N x M matrices between two sets of points,
+# built a block of rows at a time so they can be written to a memory-mapped
+# file when they don't fit in RAM. Angles are in degrees; the distance
+# comes out in the units of the radius passed in.
+#
+# Nothing here is a package: each module that uses this one appends this
+# directory to sys.path when greatcircle isn't importable already.
+
+from math import *
+
+import numpy as np
+
+R_M = 6371000.0 # Earth's radius in meters
+R_KM = R_M / 1000
+
+_NUMBERS = (int, float) # np.float64 included; math takes these directly
+
+# Elements of an N x M matrix computed at once by pairwise_chunks by default,
+# about 32 MB per float64 temporary
+CHUNK_ELEMENTS = 1 << 22
+
+def distance(lat1, lon1, lat2, lon2, radius=R_M, dtype=np.float64):
+    """Great-circle distance between points, by the haversine formula
+
+    d = distance(lat1, lon1, lat2, lon2, radius)
+
+    Input: lat1,lon1 = first point(s) (degrees)
+           lat2,lon2 = second point(s) (degrees); any shapes that
+                       broadcast against the first
+           radius    = sphere radius, in the units wanted for d
+           dtype     = np.float64, or np.float32 for half the memory
+                       (given any way NumPy takes, e.g. 'f4');
+                       float32 is good to about 1e-5 of the distance,
+                       or a meter for points close together
+    Output: d = distance(s); a float when every input is a Python (or
+                NumPy float64) number
+
+    Single pairs of numbers go through math instead of NumPy, which is
+    many times faster for one point."""
+
+    if (dtype is np.float64 and isinstance(lat1, _NUMBERS) and isinstance(lon1, _NUMBERS)
+            and isinstance(lat2, _NUMBERS) and isinstance(lon2, _NUMBERS)):
+        lat1 = lat1 * pi/180
+        lat2 = lat2 * pi/180
+        dlat = lat2 - lat1
+        dlon = (lon2 - lon1) * pi/180
+        a = sin(dlat/2)**2 + cos(lat1)*cos(lat2) * sin(dlon/2)**2
+        return float(radius * 2 * atan2(sqrt(a), sqrt(1-a)))
+
+    lat1 = np.asarray(lat1, dtype=dtype) * pi/180
+    lat2 = np.asarray(lat2, dtype=dtype) * pi/180
+    dlat = lat2 - lat1
+    dlon = (np.asarray(lon2, dtype=dtype) - np.asarray(lon1, dtype=dtype)) * pi/180
+    a = np.sin(dlat/2)**2 + np.cos(lat1)*np.cos(lat2) * np.sin(dlon/2)**2
+    return np.dtype(dtype).type(radius) * 2 * np.arctan2(np.sqrt(a), np.sqrt(1-a))
+
+def steps(lats, lons, radius=R_M, dtype=np.float64):
+    """Distances between consecutive points of a track
+
+    d = steps(lats, lons, radius)
+
+    Input: lats,lons = track positions (degrees)
+    Output: d = the n-1 step lengths, in the units of radius"""
+
+    lats = np.asarray(lats, dtype=dtype)
+    lons = np.asarray(lons, dtype=dtype)
+    return distance(lats[:-1], lons[:-1], lats[1:], lons[1:], radius, dtype)
+
+def pairwise_chunks(lats1, lons1, lats2, lons2, radius=R_M, dtype=np.float64, rows=None):
+    """The N x M matrix of distances between two sets of points, in blocks
+
+    for start, stop, block in pairwise_chunks(lats1, lons1, lats2, lons2):
+        ...
+
+    Input: lats1,lons1 = N points (degrees)
+           lats2,lons2 = M points (degrees)
+           rows        = rows per block; by default enough for about
+                         CHUNK_ELEMENTS elements
+    Output: blocks of rows start:stop of the matrix, one at a time, so
+            only one block is ever held in memory
+
+    The sines and cosines of each point are computed once, not once per
+    pair."""
+
+    lat1 = np.radians(np.asarray(lats1, dtype=dtype).ravel())
+    lon1 = np.radians(np.asarray(lons1, dtype=dtype).ravel())
+    lat2 = np.radians(np.asarray(lats2, dtype=dtype).ravel())
+    lon2 = np.radians(np.asarray(lons2, dtype=dtype).ravel())
+    cos1 = np.cos(lat1)
+    cos2 = np.cos(lat2)
+    if rows is None:
+        rows = max(1, CHUNK_ELEMENTS // max(len(lat2), 1))
+
+    for start in range(0, len(lat1), rows):
+        stop = min(start + rows, len(lat1))
+        a = np.sin((lat2 - lat1[start:stop, None]) / 2)**2
+        a += cos1[start:stop, None] * cos2 * np.sin((lon2 - lon1[start:stop, None]) / 2)**2
+        yield start, stop, np.dtype(dtype).type(radius) * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+def pairwise(lats1, lons1, lats2, lons2, radius=R_M, dtype=np.float64, rows=None, out=None):
+    """The N x M matrix of distances between two sets of points
+
+    d = pairwise(lats1, lons1, lats2, lons2, radius)
+
+    Input: lats1,lons1 = N points (degrees)
+           lats2,lons2 = M points (degrees)
+           out         = N x M array to fill instead of a new one, e.g. a
+                         np.lib.format.open_memmap file for matrices too
+                         large for memory
+    Output: d = d[i, j] is the distance from point i of the first set to
+                point j of the second"""
+
+    n = np.size(lats1)
+    m = np.size(lats2)
+    if out is None:
+        out = np.empty((n, m), dtype=dtype)
+    elif out.shape != (n, m):
+        raise ValueError('out has shape %s, not %s' % (out.shape, (n, m)))
+    for start, stop, block in pairwise_chunks(lats1, lons1, lats2, lons2, radius, dtype, rows):
+        out[start:stop] = block
+    return out